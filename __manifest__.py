@@ -1,6 +1,6 @@
 {
     'name': 'Republica Dominicana - Comprobantes Fiscales (NCF)',
-    'version': '19.0.1.1.0',
+    'version': '19.0.1.2.0',
     'summary': 'Gestion de NCF para Republica Dominicana segun normativa DGII',
     'description': 'Modulo de Comprobantes Fiscales para Republica Dominicana',
     'author': 'NewPlain',
@@ -18,13 +18,18 @@
         'views/license_config_views.xml',
         'views/ncf_type_views.xml',
         'views/ncf_sequence_views.xml',
+        'views/ncf_sequence_lease_views.xml',
+        'views/ncf_sequence_stat_views.xml',
         'views/account_move_views.xml',
         'views/res_partner_views.xml',
         'views/res_company_views.xml',
         'views/ncf_dashboard_views.xml',
         'views/ncf_alert_views.xml',
         'views/retention_views.xml',
+        'views/dgii_report_job_views.xml',
+        'views/dgii_report_batch_views.xml',
         'wizards/dgii_report_wizard_views.xml',
+        'wizards/dgii_batch_wizard_views.xml',
         'wizards/setup_wizard_views.xml',
         'views/menu_views.xml',
     ],
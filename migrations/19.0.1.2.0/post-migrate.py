@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Inicializar la marca de uso por (compania, tipo de NCF) con el mayor numero
+emitido en facturas o asignado por las secuencias existentes.
+"""
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    cr.execute("""
+        INSERT INTO l10n_do_ncf_usage_mark
+            (company_id, ncf_type_id, last_number, create_uid, create_date, write_uid, write_date)
+        SELECT company_id, ncf_type_id, MAX(last_number), 1, NOW(), 1, NOW()
+        FROM (
+            SELECT move.company_id, type.id AS ncf_type_id, MAX(move.l10n_do_ncf_serial) AS last_number
+            FROM account_move move
+            JOIN l10n_do_ncf_type type ON type.prefix = move.l10n_do_ncf_prefix
+            WHERE move.l10n_do_ncf_serial IS NOT NULL
+              AND move.state != 'cancel'
+            GROUP BY move.company_id, type.id
+            UNION ALL
+            SELECT company_id, ncf_type_id, MAX(current_number)
+            FROM l10n_do_ncf_sequence
+            WHERE current_number > 0
+            GROUP BY company_id, ncf_type_id
+        ) AS used
+        GROUP BY company_id, ncf_type_id
+        ON CONFLICT (company_id, ncf_type_id) DO UPDATE
+        SET last_number = GREATEST(l10n_do_ncf_usage_mark.last_number, EXCLUDED.last_number)
+    """)
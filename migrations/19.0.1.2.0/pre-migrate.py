@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Crear y llenar en lotes las columnas l10n_do_ncf_prefix y l10n_do_ncf_serial
+de account_move antes de que el ORM las agregue, para evitar que se
+recalculen factura por factura al actualizar el modulo.
+"""
+import logging
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50000
+# Misma regla que _compute_l10n_do_ncf_serial: hasta 10 digitos (e-CF) que quepan en la columna
+SERIAL_MAX = 2147483647
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    cr.execute("""
+        ALTER TABLE account_move
+            ADD COLUMN IF NOT EXISTS l10n_do_ncf_prefix VARCHAR,
+            ADD COLUMN IF NOT EXISTS l10n_do_ncf_serial INTEGER
+    """)
+
+    cr.execute("SELECT MIN(id), MAX(id) FROM account_move WHERE l10n_do_ncf_number IS NOT NULL")
+    min_id, max_id = cr.fetchone()
+    if min_id is None:
+        return
+
+    updated = 0
+    for start in range(min_id, max_id + 1, BATCH_SIZE):
+        cr.execute("""
+            UPDATE account_move
+            SET l10n_do_ncf_prefix = LEFT(l10n_do_ncf_number, 3),
+                l10n_do_ncf_serial = SUBSTRING(l10n_do_ncf_number FROM 4)::int
+            WHERE id >= %s AND id < %s
+              AND l10n_do_ncf_number ~ '^.{3}[0-9]{1,10}$'
+              AND CASE WHEN l10n_do_ncf_number ~ '^.{3}[0-9]{1,10}$'
+                       THEN SUBSTRING(l10n_do_ncf_number FROM 4)::bigint <= %s
+                  END
+        """, (start, start + BATCH_SIZE, SERIAL_MAX))
+        updated += cr.rowcount
+        _logger.info('NCF: secuencial NCF calculado para %s facturas (hasta id %s)',
+                     updated, min(start + BATCH_SIZE - 1, max_id))
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 from . import ncf_type
 from . import ncf_sequence
+from . import ncf_sequence_lease
+from . import ncf_sequence_native
+from . import ncf_sequence_stat
+from . import ncf_voided
+from . import ncf_usage_mark
 from . import account_move
 from . import res_partner
 from . import res_company
@@ -9,3 +14,7 @@ from . import ncf_dashboard
 from . import ncf_alert
 from . import retention
 from . import dgii_reminder
+from . import dgii_report_job
+from . import dgii_report_batch
+from . import fiscal_ledger
+from . import dgii_report_cache
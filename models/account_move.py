@@ -2,13 +2,22 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from psycopg2.errors import UniqueViolation
+from .ncf_sequence_stat import elapsed_ms
 import re
 import requests
 import logging
-import traceback
+import time
+from collections import defaultdict
 
 _logger = logging.getLogger(__name__)
 
+# Claves de contexto con las que se cargan datos demo o se ejecutan pruebas
+DEMO_CONTEXT_KEYS = ('install_mode', 'module', 'demo', 'test_mode', 'load_demo_data')
+# Secuencial: hasta 10 digitos (e-CF) y dentro del rango de la columna entera
+NCF_SERIAL_DIGITS = 10
+NCF_SERIAL_MAX = 2147483647
+
 
 class AccountMove(models.Model):
     _inherit = 'account.move'
@@ -38,6 +47,18 @@ class AccountMove(models.Model):
         related='l10n_do_ncf_seq_id.expiration_date',
         store=True
     )
+    l10n_do_ncf_prefix = fields.Char(
+        string='Serie NCF',
+        compute='_compute_l10n_do_ncf_serial',
+        store=True,
+        help='Prefijo del NCF asignado (ej: B01)'
+    )
+    l10n_do_ncf_serial = fields.Integer(
+        string='Secuencial NCF',
+        compute='_compute_l10n_do_ncf_serial',
+        store=True,
+        help='Parte numerica del NCF asignado'
+    )
     l10n_do_ncf_origin = fields.Char(
         string='NCF Afectado',
         copy=False,
@@ -85,30 +106,56 @@ class AccountMove(models.Model):
         ('11', '11 - Gastos de Seguros'),
     ], string='Tipo de Gasto', default='02', help='Clasificacion de gasto para reporte 606')
 
+    _l10n_do_ncf_number_uniq = models.UniqueIndex(
+        "(company_id, l10n_do_ncf_number) WHERE state != 'cancel' AND l10n_do_ncf_number IS NOT NULL",
+        "El NCF ya existe en otra factura de la compania.\n\nContacte al administrador del sistema.",
+    )
+    _l10n_do_ncf_serial_idx = models.Index(
+        "(company_id, l10n_do_ncf_prefix, l10n_do_ncf_serial) WHERE l10n_do_ncf_serial IS NOT NULL",
+    )
+    _l10n_do_vendor_ncf_uniq = models.UniqueIndex(
+        "(company_id, partner_id, l10n_do_vendor_ncf) WHERE state != 'cancel' AND l10n_do_vendor_ncf IS NOT NULL",
+        "Ya existe una factura con este NCF para este proveedor.",
+    )
+
+    @api.depends('l10n_do_ncf_number')
+    def _compute_l10n_do_ncf_serial(self):
+        for move in self:
+            ncf = move.l10n_do_ncf_number or ''
+            serial = ncf[3:]
+            if len(ncf) > 3 and serial.isdigit() and len(serial) <= NCF_SERIAL_DIGITS \
+                    and int(serial) <= NCF_SERIAL_MAX:
+                move.l10n_do_ncf_prefix = ncf[:3]
+                move.l10n_do_ncf_serial = int(serial)
+            else:
+                move.l10n_do_ncf_prefix = False
+                move.l10n_do_ncf_serial = False
+
     def _get_ncf_type_for_partner(self, partner):
         """Obtener el tipo de NCF correcto segun el tipo de cliente"""
+        NcfType = self.env['l10n_do_ncf.type']
         if not partner:
-            return self.env['l10n_do_ncf.type'].search([('code', '=', '02')], limit=1)
+            return NcfType._get_by_code('02')
 
         taxpayer_type = partner.l10n_do_dgii_tax_payer_type
         partner_vat = partner.vat
 
         if taxpayer_type == 'governmental':
-            ncf_type = self.env['l10n_do_ncf.type'].search([('code', '=', '15')], limit=1)
+            ncf_type = NcfType._get_by_code('15')
             if ncf_type:
                 return ncf_type
 
         if taxpayer_type == 'special_regime':
-            ncf_type = self.env['l10n_do_ncf.type'].search([('code', '=', '14')], limit=1)
+            ncf_type = NcfType._get_by_code('14')
             if ncf_type:
                 return ncf_type
 
         if taxpayer_type == 'taxpayer' and partner_vat:
-            ncf_type = self.env['l10n_do_ncf.type'].search([('code', '=', '01')], limit=1)
+            ncf_type = NcfType._get_by_code('01')
             if ncf_type:
                 return ncf_type
 
-        return self.env['l10n_do_ncf.type'].search([('code', '=', '02')], limit=1)
+        return NcfType._get_by_code('02')
 
     def _get_ncf_type_for_move(self):
         """Obtener el tipo de NCF correcto segun el tipo de documento"""
@@ -117,40 +164,71 @@ class AccountMove(models.Model):
         if self.move_type == 'out_invoice' and self.partner_id:
             return self._get_ncf_type_for_partner(self.partner_id)
         elif self.move_type == 'out_refund':
-            return self.env['l10n_do_ncf.type'].search([('code', '=', '04')], limit=1)
+            return self.env['l10n_do_ncf.type']._get_by_code('04')
 
         return False
 
     @api.model_create_multi
     def create(self, vals_list):
         """Asignar tipo NCF y datos automaticamente al crear el documento"""
-        moves = super().create(vals_list)
-
-        for move in moves:
-            vals_to_update = {}
-
-            if move.move_type == 'out_refund':
-                if not move.l10n_do_ncf_type_id:
-                    ncf_type = self.env['l10n_do_ncf.type'].search([('code', '=', '04')], limit=1)
-                    if ncf_type:
-                        vals_to_update['l10n_do_ncf_type_id'] = ncf_type.id
-
-                if move.reversed_entry_id:
-                    if move.reversed_entry_id.l10n_do_ncf_number and not move.l10n_do_ncf_origin:
-                        vals_to_update['l10n_do_ncf_origin'] = move.reversed_entry_id.l10n_do_ncf_number
-                    if not move.l10n_do_origin_move_id:
-                        vals_to_update['l10n_do_origin_move_id'] = move.reversed_entry_id.id
-
-            elif move.move_type == 'out_invoice' and move.partner_id:
-                if not move.l10n_do_ncf_type_id:
-                    ncf_type = move._get_ncf_type_for_partner(move.partner_id)
-                    if ncf_type:
-                        vals_to_update['l10n_do_ncf_type_id'] = ncf_type.id
-
-            if vals_to_update:
-                move.write(vals_to_update)
-
-        return moves
+        return super().create(self._prepare_ncf_create_vals(vals_list))
+
+    @api.model
+    def _prepare_ncf_create_vals(self, vals_list):
+        """
+        Completar tipo NCF, NCF afectado y factura origen en los valores de
+        creacion. Los clientes y las facturas revertidas se leen en lote,
+        de modo que no hace falta una escritura posterior por factura.
+        """
+        default_move_type = self.env.context.get('default_move_type')
+        default_partner_id = self.env.context.get('default_partner_id')
+        # Un tipo NCF por defecto en el contexto cuenta como ya elegido
+        default_ncf_type_id = self.env.context.get('default_l10n_do_ncf_type_id')
+
+        partner_ids = set()
+        reversed_ids = set()
+        for vals in vals_list:
+            move_type = vals.get('move_type', default_move_type)
+            if move_type == 'out_invoice' and not vals.get('l10n_do_ncf_type_id', default_ncf_type_id):
+                partner_id = vals.get('partner_id', default_partner_id)
+                if partner_id:
+                    partner_ids.add(partner_id)
+            elif move_type == 'out_refund' and vals.get('reversed_entry_id'):
+                reversed_ids.add(vals['reversed_entry_id'])
+
+        partners = self.env['res.partner'].browse(partner_ids)
+        partners.fetch(['l10n_do_dgii_tax_payer_type', 'vat'])
+        type_by_partner = {partner.id: self._get_ncf_type_for_partner(partner) for partner in partners}
+
+        reversed_moves = self.browse(reversed_ids)
+        reversed_moves.fetch(['l10n_do_ncf_number'])
+        ncf_by_reversed = {move.id: move.l10n_do_ncf_number for move in reversed_moves}
+
+        credit_note_type = self.env['l10n_do_ncf.type']._get_by_code('04')
+
+        result = []
+        for vals in vals_list:
+            vals = dict(vals)
+            move_type = vals.get('move_type', default_move_type)
+
+            if move_type == 'out_refund':
+                if not vals.get('l10n_do_ncf_type_id', default_ncf_type_id) and credit_note_type:
+                    vals['l10n_do_ncf_type_id'] = credit_note_type.id
+
+                reversed_id = vals.get('reversed_entry_id')
+                if reversed_id:
+                    if ncf_by_reversed.get(reversed_id) and not vals.get('l10n_do_ncf_origin'):
+                        vals['l10n_do_ncf_origin'] = ncf_by_reversed[reversed_id]
+                    if not vals.get('l10n_do_origin_move_id'):
+                        vals['l10n_do_origin_move_id'] = reversed_id
+
+            elif move_type == 'out_invoice' and not vals.get('l10n_do_ncf_type_id', default_ncf_type_id):
+                ncf_type = type_by_partner.get(vals.get('partner_id', default_partner_id))
+                if ncf_type:
+                    vals['l10n_do_ncf_type_id'] = ncf_type.id
+
+            result.append(vals)
+        return result
 
     def write(self, vals):
         """Interceptar escritura para asignar tipo NCF en reversiones"""
@@ -162,7 +240,7 @@ class AccountMove(models.Model):
                     vals_to_update = {}
 
                     if not move.l10n_do_ncf_type_id:
-                        ncf_type = self.env['l10n_do_ncf.type'].search([('code', '=', '04')], limit=1)
+                        ncf_type = self.env['l10n_do_ncf.type']._get_by_code('04')
                         if ncf_type:
                             vals_to_update['l10n_do_ncf_type_id'] = ncf_type.id
 
@@ -186,7 +264,7 @@ class AccountMove(models.Model):
                 self.l10n_do_ncf_type_id = ncf_type.id
 
         elif self.move_type == 'out_refund':
-            ncf_type = self.env['l10n_do_ncf.type'].search([('code', '=', '04')], limit=1)
+            ncf_type = self.env['l10n_do_ncf.type']._get_by_code('04')
             if ncf_type:
                 self.l10n_do_ncf_type_id = ncf_type.id
 
@@ -199,35 +277,20 @@ class AccountMove(models.Model):
     @api.constrains('l10n_do_ncf_origin', 'move_type')
     def _check_ncf_origin_required(self):
         """Validar que las Notas de Credito tengan NCF afectado"""
+        demo_mode = None
         for move in self:
             if move.move_type == 'out_refund' and move.state == 'posted':
                 if not move.l10n_do_ncf_origin:
                     # Saltar en modo demo
-                    if move._is_demo_or_test_mode():
+                    if demo_mode is None:
+                        demo_mode = self._is_demo_or_test_mode()
+                    if demo_mode:
                         continue
                     raise ValidationError(_(
                         'Las Notas de Credito requieren el NCF Afectado.\n'
                         'Debe indicar el NCF de la factura original que esta modificando.'
                     ))
 
-    @api.constrains('l10n_do_ncf_number', 'company_id')
-    def _check_ncf_unique(self):
-        """Validar que el NCF generado no este duplicado (para ventas)"""
-        for move in self:
-            if move.l10n_do_ncf_number and move.move_type in ('out_invoice', 'out_refund'):
-                existing = self.search([
-                    ('l10n_do_ncf_number', '=', move.l10n_do_ncf_number),
-                    ('company_id', '=', move.company_id.id),
-                    ('id', '!=', move.id),
-                    ('state', '!=', 'cancel'),
-                ])
-                if existing:
-                    raise ValidationError(_(
-                        'El NCF %s ya existe.\n'
-                        'Factura existente: %s\n\n'
-                        'Contacte al administrador del sistema.'
-                    ) % (move.l10n_do_ncf_number, existing[0].name))
-
     @api.constrains('l10n_do_vendor_ncf')
     def _check_vendor_ncf_format(self):
         """Validar formato del NCF del proveedor"""
@@ -242,144 +305,209 @@ class AccountMove(models.Model):
                         'B = Serie, 01 = Tipo, 00000001 = Secuencia'
                     ))
 
-    @api.constrains('l10n_do_vendor_ncf', 'partner_id', 'company_id')
-    def _check_vendor_ncf_unique(self):
-        """Validar que el NCF del proveedor no este duplicado"""
-        for move in self:
-            if move.l10n_do_vendor_ncf and move.partner_id:
-                existing = self.search([
-                    ('l10n_do_vendor_ncf', '=', move.l10n_do_vendor_ncf),
-                    ('partner_id', '=', move.partner_id.id),
-                    ('company_id', '=', move.company_id.id),
-                    ('id', '!=', move.id),
-                    ('state', '!=', 'cancel'),
-                ])
-                if existing:
-                    raise ValidationError(_(
-                        'Ya existe una factura con el NCF %s para este proveedor.\n'
-                        'Factura existente: %s'
-                    ) % (move.l10n_do_vendor_ncf, existing[0].name))
-
     def _get_ncf_sequence(self):
         """Obtener la secuencia NCF activa para el tipo de comprobante"""
         self.ensure_one()
-        if not self.l10n_do_ncf_type_id:
-            raise UserError(_(
-                'No se ha definido el tipo de comprobante fiscal.\n'
-                'Esto puede ocurrir si el cliente no tiene configurado correctamente su tipo de contribuyente.'
-            ))
-
-        sequence = self.env['l10n_do_ncf.sequence'].search([
-            ('company_id', '=', self.company_id.id),
-            ('ncf_type_id', '=', self.l10n_do_ncf_type_id.id),
-            ('state', '=', 'active'),
-        ], limit=1, order='id desc')
+        return self._get_ncf_sequences()[self.id]
 
-        if not sequence:
-            raise UserError(_(
-                'No hay una secuencia NCF activa para "%s".\n\n'
-                'Para configurar una secuencia:\n'
-                '1. Vaya a Facturacion > Configuracion > NCF > Secuencias\n'
-                '2. Cree una nueva secuencia para este tipo\n'
-                '3. Ingrese el rango autorizado por DGII\n'
-                '4. Active la secuencia'
-            ) % self.l10n_do_ncf_type_id.name)
+    def _get_ncf_sequences(self):
+        """
+        Obtener la secuencia NCF activa de cada factura.
+        Se resuelve una vez por (compania, tipo de NCF), no por factura.
 
-        return sequence
+        :return: diccionario {move.id: secuencia}
+        """
+        for move in self:
+            if not move.l10n_do_ncf_type_id:
+                raise UserError(_(
+                    'No se ha definido el tipo de comprobante fiscal.\n'
+                    'Esto puede ocurrir si el cliente no tiene configurado correctamente su tipo de contribuyente.\n'
+                    'Documento: %s'
+                ) % move.display_name)
+
+        sequences = self.env['l10n_do_ncf.sequence']._get_active_sequences(
+            (move.company_id.id, move.l10n_do_ncf_type_id.id) for move in self
+        )
+
+        result = {}
+        for move in self:
+            sequence = sequences[(move.company_id.id, move.l10n_do_ncf_type_id.id)]
+            if not sequence:
+                raise UserError(_(
+                    'No hay una secuencia NCF activa para "%s".\n\n'
+                    'Para configurar una secuencia:\n'
+                    '1. Vaya a Facturacion > Configuracion > NCF > Secuencias\n'
+                    '2. Cree una nueva secuencia para este tipo\n'
+                    '3. Ingrese el rango autorizado por DGII\n'
+                    '4. Active la secuencia\n\n'
+                    'Documento: %s'
+                ) % (move.l10n_do_ncf_type_id.name, move.display_name))
+            result[move.id] = sequence
+        return result
 
     def _generate_ncf(self):
-        """Generar el NCF para la factura"""
-        self.ensure_one()
-        if self.l10n_do_ncf_number:
-            return self.l10n_do_ncf_number
-
-        sequence = self._get_ncf_sequence()
-        ncf = sequence.get_next_ncf()
-
-        self.write({
-            'l10n_do_ncf_number': ncf,
-            'l10n_do_ncf_seq_id': sequence.id,
-        })
-        return ncf
+        """
+        Generar el NCF para las facturas.
+        Reserva un bloque de NCF contiguos por secuencia y lo asigna a todas
+        las facturas del grupo con una sola escritura por tramo de rango.
+        """
+        to_number = self.filtered(lambda m: not m.l10n_do_ncf_number)
+        sequences = to_number._get_ncf_sequences()
+        moves_by_sequence = defaultdict(list)
+        for move in to_number:
+            moves_by_sequence[sequences[move.id]].append(move.id)
+
+        for sequence, move_ids in moves_by_sequence.items():
+            try:
+                segments = sequence._reserve_ncf_segments(len(move_ids))
+            except UserError as e:
+                raise UserError(_('%s\n\nDocumentos: %s') % (
+                    e.args[0], self.browse(move_ids)._l10n_do_describe_moves()
+                )) from e
+
+            # Un bloque puede continuar en la secuencia sucesora
+            offset = 0
+            for segment_sequence, ncfs in segments:
+                segment_ids = move_ids[offset:offset + len(ncfs)]
+                self.browse(segment_ids)._assign_ncf_numbers(segment_sequence, ncfs)
+                offset += len(ncfs)
+
+        return self.mapped('l10n_do_ncf_number')
+
+    def _assign_ncf_numbers(self, sequence, ncfs):
+        """Escribir los NCF reservados en las facturas con un solo UPDATE"""
+        if len(self) != len(ncfs):
+            raise UserError(_('La cantidad de NCF reservados no coincide con la cantidad de facturas.'))
+
+        fnames = ['l10n_do_ncf_number', 'l10n_do_ncf_seq_id']
+        self.flush_recordset(fnames)
+        # El UPDATE no pasa por write(): registrar los valores iniciales para
+        # que el seguimiento publique en el chatter el NCF asignado
+        self._track_prepare(['l10n_do_ncf_number'])
+        start = time.perf_counter()
+        try:
+            self.env.cr.execute("""
+                UPDATE account_move AS move
+                SET l10n_do_ncf_number = data.ncf,
+                    l10n_do_ncf_prefix = CASE WHEN data.serial IS NOT NULL THEN LEFT(data.ncf, 3) END,
+                    l10n_do_ncf_serial = data.serial,
+                    l10n_do_ncf_seq_id = %s,
+                    write_date = NOW(),
+                    write_uid = %s
+                FROM (
+                    SELECT id, ncf,
+                           -- Misma regla que _compute_l10n_do_ncf_serial
+                           CASE WHEN ncf ~ %s THEN
+                               CASE WHEN SUBSTRING(ncf FROM 4)::bigint <= %s
+                                    THEN SUBSTRING(ncf FROM 4)::int END
+                           END AS serial
+                    FROM UNNEST(%s::int[], %s::varchar[]) AS input(id, ncf)
+                ) AS data
+                WHERE move.id = data.id
+            """, (sequence.id, self.env.uid, '^.{3}[0-9]{1,%d}$' % NCF_SERIAL_DIGITS, NCF_SERIAL_MAX,
+                  self.ids, list(ncfs)))
+        except UniqueViolation as e:
+            # El indice unico parcial detecta el duplicado; la transaccion se revierte
+            raise UserError(_(
+                'ERROR CRITICO: NCF Duplicado Detectado [%s]\n\n'
+                'Uno de los NCF reservados (%s a %s) ya existe en otra factura.\n'
+                '%s\n\n'
+                'Contacte al administrador del sistema.'
+            ) % (sequence.prefix, ncfs[0], ncfs[-1], e.diag.message_detail or ''))
+        # El prefijo y secuencial ya se escribieron en el mismo UPDATE
+        serial_fields = [self._fields['l10n_do_ncf_prefix'], self._fields['l10n_do_ncf_serial']]
+        self.invalidate_recordset(fnames + [field.name for field in serial_fields])
+        self.modified(fnames)
+        for field in serial_fields:
+            self.env.remove_to_compute(field, self)
+        self.env['l10n_do_ncf.sequence.stat']._record(sequence.id, assign_ms=elapsed_ms(start))
 
     def _is_demo_or_test_mode(self):
-        """Detectar si estamos en modo demo o test"""
-        # Verificar contexto
-        if self.env.context.get('install_mode'):
-            _logger.info("NCF: Modo demo detectado por install_mode")
+        """
+        Detectar si estamos en modo demo o test.
+        Solo depende del contexto y del registro: los datos demo (incluido
+        account_demo) se cargan antes de que el registro este listo.
+        """
+        context = self.env.context
+        if any(context.get(key) for key in DEMO_CONTEXT_KEYS):
             return True
-        if self.env.context.get('module'):
-            _logger.info("NCF: Modo demo detectado por module context")
-            return True
-        if self.env.context.get('demo'):
-            _logger.info("NCF: Modo demo detectado por demo context")
-            return True
-        if self.env.context.get('test_mode'):
-            _logger.info("NCF: Modo demo detectado por test_mode")
-            return True
-        if self.env.context.get('load_demo_data'):
-            _logger.info("NCF: Modo demo detectado por load_demo_data")
-            return True
-        # Verificar registry en modo test
-        if hasattr(self.env.registry, 'in_test_mode') and self.env.registry.in_test_mode():
-            _logger.info("NCF: Modo demo detectado por registry.in_test_mode")
-            return True
-        # Verificar stack trace para account_demo
-        stack = traceback.format_stack()
-        stack_str = ''.join(stack)
-        if 'account_demo' in stack_str or '_post_load_demo_data' in stack_str or 'force-demo' in stack_str:
-            _logger.info("NCF: Modo demo detectado por stack trace (account_demo)")
-            return True
-        return False
+        registry = self.env.registry
+        return not registry.ready or registry.in_test_mode()
 
     def action_post(self):
         """Validar licencia y generar NCF al confirmar factura"""
-        for move in self:
-            # Saltar validaciones NCF en modo demo
-            if move._is_demo_or_test_mode():
-                continue
-
-            if (move.move_type in ('out_invoice', 'out_refund') and
-                move.company_id.country_id.code == 'DO'):
-
-                if move.move_type == 'out_refund' and not move.l10n_do_ncf_origin:
-                    raise UserError(_(
-                        'Debe indicar el NCF Afectado.\n\n'
-                        'Las Notas de Credito deben referenciar el NCF de la factura original.'
-                    ))
+        # Saltar validaciones NCF en modo demo
+        if self._is_demo_or_test_mode():
+            return super().action_post()
 
-                if not move.l10n_do_ncf_type_id:
-                    ncf_type = move._get_ncf_type_for_move()
-                    if ncf_type:
-                        move.l10n_do_ncf_type_id = ncf_type.id
-
-                if move.l10n_do_ncf_type_id and not move.l10n_do_ncf_number:
-                    license_config = self.env['l10n_do_ncf.license.config'].search([
-                        ('company_id', '=', move.company_id.id)
-                    ], limit=1)
-
-                    if not license_config:
-                        raise UserError(_(
-                            'Licencia NCF no configurada.\n\n'
-                            'Para configurar su licencia:\n'
-                            '1. Vaya a Facturacion > Configuracion > NCF > Licencia NCF\n'
-                            '2. Ingrese su clave de licencia\n'
-                            '3. Ingrese el RNC de su empresa\n'
-                            '4. Haga clic en Validar Licencia'
-                        ))
-
-                    if not license_config.is_valid:
-                        raise UserError(_(
-                            'Licencia NCF no valida o expirada.\n\n'
-                            'Estado: %s\n'
-                            'Mensaje: %s\n\n'
-                            'Contacte a soporte para renovar su licencia.'
-                        ) % (license_config.status, license_config.validation_message or ''))
-
-                    move._generate_ncf()
+        self._l10n_do_prepare_ncf_post()._generate_ncf()
 
         return super().action_post()
 
+    def _l10n_do_describe_moves(self, limit=10):
+        """Nombres de las facturas para los mensajes de error"""
+        names = [move.display_name for move in self[:limit]]
+        if len(self) > limit:
+            names.append(_('y %s mas') % (len(self) - limit))
+        return ', '.join(names)
+
+    def _l10n_do_prepare_ncf_post(self):
+        """
+        Validar y completar las facturas dominicanas antes de confirmar.
+        El tipo de NCF se asigna con una escritura por tipo y la licencia se
+        verifica una vez por compania.
+
+        :return: facturas que necesitan NCF
+        """
+        dominican = self.filtered(lambda m: (
+            m.move_type in ('out_invoice', 'out_refund')
+            and m.company_id.country_id.code == 'DO'
+        ))
+
+        for move in dominican:
+            if move.move_type == 'out_refund' and not move.l10n_do_ncf_origin:
+                raise UserError(_(
+                    'Debe indicar el NCF Afectado.\n\n'
+                    'Las Notas de Credito deben referenciar el NCF de la factura original.\n'
+                    'Documento: %s'
+                ) % move.display_name)
+
+        ids_by_type = defaultdict(list)
+        for move in dominican.filtered(lambda m: not m.l10n_do_ncf_type_id):
+            ncf_type = move._get_ncf_type_for_move()
+            if ncf_type:
+                ids_by_type[ncf_type.id].append(move.id)
+        for ncf_type_id, move_ids in ids_by_type.items():
+            self.browse(move_ids).write({'l10n_do_ncf_type_id': ncf_type_id})
+
+        to_number = dominican.filtered(lambda m: m.l10n_do_ncf_type_id and not m.l10n_do_ncf_number)
+
+        License = self.env['l10n_do_ncf.license.config']
+        for company in to_number.company_id:
+            configured, is_valid, status, message = License._get_license_state(company.id)
+
+            if not configured:
+                raise UserError(_(
+                    'Licencia NCF no configurada.\n\n'
+                    'Para configurar su licencia:\n'
+                    '1. Vaya a Facturacion > Configuracion > NCF > Licencia NCF\n'
+                    '2. Ingrese su clave de licencia\n'
+                    '3. Ingrese el RNC de su empresa\n'
+                    '4. Haga clic en Validar Licencia\n\n'
+                    'Compania: %s'
+                ) % company.name)
+
+            if not is_valid:
+                raise UserError(_(
+                    'Licencia NCF no valida o expirada.\n\n'
+                    'Estado: %s\n'
+                    'Mensaje: %s\n'
+                    'Compania: %s\n\n'
+                    'Contacte a soporte para renovar su licencia.'
+                ) % (status, message, company.name))
+
+        return to_number
+
     def _get_ncf_type_from_number(self, ncf):
         """Extraer el tipo de NCF del numero"""
         if ncf and len(ncf) >= 3:
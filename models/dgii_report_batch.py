@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.tools import SQL
+from psycopg2.errors import SerializationFailure
+from .dgii_report_writer import store_file, temp_directory
+import logging
+import os
+import re
+import tempfile
+import zipfile
+
+_logger = logging.getLogger(__name__)
+
+
+class DgiiReportBatch(models.Model):
+    """
+    Lote de reportes DGII de varias companias y periodos. Cada reporte es un
+    trabajo en segundo plano; cuando todos terminan, sus archivos se reunen
+    en un solo ZIP con un RESUMEN.txt.
+    """
+    _name = 'l10n_do_ncf.dgii.report.batch'
+    _description = 'Lote de Reportes DGII'
+    _inherit = ['mail.thread']
+    _order = 'id desc'
+
+    name = fields.Char(string='Lote', compute='_compute_name', store=True)
+    user_id = fields.Many2one(
+        'res.users',
+        string='Solicitado por',
+        readonly=True,
+        default=lambda self: self.env.user
+    )
+    company_ids = fields.Many2many('res.company', string='Companias', readonly=True)
+    date_from = fields.Date(string='Desde', required=True, readonly=True)
+    date_to = fields.Date(string='Hasta', required=True, readonly=True)
+    job_ids = fields.One2many('l10n_do_ncf.dgii.report.job', 'batch_id', string='Reportes', readonly=True)
+    job_count = fields.Integer(string='Reportes', compute='_compute_progress')
+    finished_count = fields.Integer(string='Terminados', compute='_compute_progress')
+    failed_count = fields.Integer(string='Fallidos', compute='_compute_progress')
+    progress = fields.Float(string='Progreso', compute='_compute_progress')
+    state = fields.Selection([
+        ('running', 'En Proceso'),
+        ('done', 'Terminado'),
+    ], string='Estado', default='running', readonly=True, tracking=True)
+
+    attachment_id = fields.Many2one('ir.attachment', string='Archivo', readonly=True)
+    file_name = fields.Char(string='Nombre del Archivo', readonly=True)
+    summary = fields.Text(string='Resumen', readonly=True)
+    date_done = fields.Datetime(string='Terminado el', readonly=True)
+
+    @api.depends('date_from', 'date_to')
+    def _compute_name(self):
+        for batch in self:
+            if batch.date_from and batch.date_to:
+                batch.name = f"Lote {batch.date_from.strftime('%Y%m')}-{batch.date_to.strftime('%Y%m')}"
+            else:
+                batch.name = _('Lote')
+
+    @api.depends('job_ids.state')
+    def _compute_progress(self):
+        for batch in self:
+            jobs = batch.job_ids
+            finished = jobs.filtered(lambda j: j.state in ('done', 'failed'))
+            batch.job_count = len(jobs)
+            batch.finished_count = len(finished)
+            batch.failed_count = len(finished.filtered(lambda j: j.state == 'failed'))
+            batch.progress = len(finished) * 100.0 / len(jobs) if jobs else 0.0
+
+    def unlink(self):
+        self.job_ids.unlink()
+        self.attachment_id.sudo().unlink()
+        return super().unlink()
+
+    def action_download(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{self.attachment_id.id}?download=true',
+            'target': 'self',
+        }
+
+    def action_view_jobs(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window']._for_xml_id('l10n_do_ncf.action_dgii_report_job')
+        action['domain'] = [('batch_id', '=', self.id)]
+        action['context'] = {}
+        return action
+
+    # =====================================================
+    # ARCHIVO DEL LOTE
+    # =====================================================
+    @api.model
+    def _cron_finish_batches(self):
+        """
+        Armar el ZIP de los lotes cuyos trabajos ya terminaron. Lo llaman los
+        crons de trabajos al quedarse sin trabajos pendientes; el bloqueo
+        evita que dos de ellos armen el mismo lote.
+        """
+        while True:
+            try:
+                self.env.cr.execute(SQL("""
+                    SELECT b.id FROM l10n_do_ncf_dgii_report_batch b
+                    WHERE b.state = 'running'
+                      AND NOT EXISTS (
+                          SELECT 1 FROM l10n_do_ncf_dgii_report_job j
+                          WHERE j.batch_id = b.id AND j.state IN ('queued', 'running')
+                      )
+                    ORDER BY b.id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                """))
+            except SerializationFailure:
+                # Otro cron termino el lote despues de que empezo esta transaccion
+                self.env.cr.rollback()
+                return
+            row = self.env.cr.fetchone()
+            if not row:
+                return
+            batch = self.browse(row[0])
+            try:
+                with self.env.cr.savepoint():
+                    batch._build_archive()
+            except Exception as e:
+                _logger.exception('DGII: no se pudo armar el archivo del lote %s', batch.id)
+                batch.write({
+                    'state': 'done',
+                    'summary': _('No se pudo armar el archivo del lote: %s') % e,
+                    'date_done': fields.Datetime.now(),
+                })
+            self.env.cr.commit()
+
+    def _build_archive(self):
+        """Reunir los archivos de los trabajos terminados en un ZIP y avisar al usuario"""
+        self.ensure_one()
+        handle, zip_path = tempfile.mkstemp(prefix='dgii_batch_', suffix='.zip', dir=temp_directory(self.env))
+        os.close(handle)
+        jobs = self.job_ids.sorted(lambda j: (j.company_id.name, j.date_from, j.report_type))
+        summary = []
+        try:
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for job in jobs:
+                    label = f"{job.company_id.name} - {job.report_type} - {job.date_from.strftime('%Y%m')}"
+                    if job.state != 'done':
+                        summary.append(f'{label}: ERROR - {job.error_message or ""}')
+                        continue
+                    attachment = job.attachment_id.sudo()
+                    folder = re.sub(r'[^\w.-]+', '_', job.company_id.name)
+                    arcname = f'{folder}/{job.file_name}'
+                    if attachment.store_fname:
+                        archive.write(attachment._full_path(attachment.store_fname), arcname)
+                    else:
+                        archive.writestr(arcname, attachment.raw)
+                    summary.append(f'{label}: {arcname}')
+                archive.writestr('RESUMEN.txt', '\n'.join(summary))
+        except Exception:
+            os.unlink(zip_path)
+            raise
+
+        file_name = f"DGII_Lote_{self.date_from.strftime('%Y%m')}_{self.date_to.strftime('%Y%m')}.zip"
+        self.attachment_id.sudo().unlink()
+        attachment = store_file(
+            self.env, zip_path, file_name, mimetype='application/zip',
+            res_model=self._name, res_id=self.id,
+        )
+        self.write({
+            'state': 'done',
+            'attachment_id': attachment.id,
+            'file_name': file_name,
+            'summary': '\n'.join(summary),
+            'date_done': fields.Datetime.now(),
+        })
+        self.message_post(
+            body=_('El lote %s esta listo: %s reportes, %s fallidos.') % (
+                self.name, self.job_count - self.failed_count, self.failed_count),
+            attachment_ids=attachment.ids,
+            partner_ids=self.user_id.partner_id.ids,
+            message_type='comment',
+            subtype_xmlid='mail.mt_comment',
+        )
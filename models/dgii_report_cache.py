@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+from psycopg2.errors import UniqueViolation
+import hashlib
+
+
+class DgiiReportCache(models.Model):
+    """
+    Ultimo archivo generado de cada reporte, compania y periodo, con la
+    version de los datos con que se genero. Si la version no cambia, el
+    asistente devuelve el archivo guardado sin volver a generarlo.
+    """
+    _name = 'l10n_do_ncf.dgii.report.cache'
+    _description = 'Cache de Reportes DGII Generados'
+    _order = 'date_from desc, company_id, report_type'
+    _rec_name = 'file_name'
+
+    company_id = fields.Many2one('res.company', string='Compania', required=True, readonly=True,
+                                 ondelete='cascade')
+    report_type = fields.Char(string='Tipo de Reporte', required=True, readonly=True)
+    date_from = fields.Date(string='Desde', required=True, readonly=True)
+    date_to = fields.Date(string='Hasta', required=True, readonly=True)
+    version = fields.Char(string='Version de los Datos', readonly=True)
+    attachment_id = fields.Many2one('ir.attachment', string='Archivo', readonly=True)
+    file_name = fields.Char(string='Nombre del Archivo', readonly=True)
+    record_count = fields.Integer(string='Registros', readonly=True)
+    total_amount = fields.Float(string='Monto Total', readonly=True)
+    total_itbis = fields.Float(string='Total ITBIS', readonly=True)
+
+    _report_period_uniq = models.Constraint(
+        'UNIQUE(company_id, report_type, date_from, date_to)',
+        'Ya existe un reporte guardado para esta compania y periodo.',
+    )
+
+    @api.model
+    def _get_version(self, wizard):
+        """
+        Version de los datos de un reporte: cantidad y ultima modificacion
+        de las facturas del periodo y sus contactos, retenciones, anulaciones
+        y lineas del libro fiscal, y si alguna linea esta por recalcular.
+        Confirmar, cancelar o modificar una factura del periodo, o editar
+        uno de sus contactos, cambia la version.
+        """
+        self.env.flush_all()
+        period = SQL(
+            "m.company_id = %s AND m.invoice_date BETWEEN %s AND %s",
+            wizard.company_id.id, wizard.date_from, wizard.date_to,
+        )
+        self.env.cr.execute(SQL("""
+            SELECT
+                (SELECT ROW(COUNT(*), MAX(m.write_date), MAX(p.write_date))
+                   FROM account_move m
+                   LEFT JOIN res_partner p ON p.id = m.partner_id
+                  WHERE %(period)s),
+                (SELECT ROW(COUNT(*), MAX(r.write_date))
+                   FROM l10n_do_ncf_move_retention r
+                   JOIN account_move m ON m.id = r.move_id
+                  WHERE %(period)s),
+                (SELECT ROW(COUNT(*), MAX(v.write_date))
+                   FROM l10n_do_ncf_voided v
+                  WHERE v.company_id = %(company)s AND v.date BETWEEN %(date_from)s AND %(date_to)s),
+                (SELECT ROW(COUNT(*), MAX(l.write_date), BOOL_OR(l.stale))
+                   FROM l10n_do_ncf_fiscal_ledger l
+                  WHERE l.company_id = %(company)s AND l.report_type = %(report_type)s
+                    AND l.invoice_date BETWEEN %(date_from)s AND %(date_to)s)
+        """,
+            period=period, company=wizard.company_id.id, report_type=wizard.report_type,
+            date_from=wizard.date_from, date_to=wizard.date_to,
+        ))
+        key = repr((self.env.cr.fetchone(), wizard.company_id.vat, wizard.company_id.name))
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    @api.model
+    def _get_entry(self, wizard):
+        return self.search([
+            ('company_id', '=', wizard.company_id.id),
+            ('report_type', '=', wizard.report_type),
+            ('date_from', '=', wizard.date_from),
+            ('date_to', '=', wizard.date_to),
+        ], limit=1)
+
+    @api.model
+    def _store(self, wizard, version):
+        """Guardar el archivo recien generado por el asistente en su entrada"""
+        entry = self._get_entry(wizard)
+        if not entry:
+            try:
+                with self.env.cr.savepoint():
+                    entry = self.create({
+                        'company_id': wizard.company_id.id,
+                        'report_type': wizard.report_type,
+                        'date_from': wizard.date_from,
+                        'date_to': wizard.date_to,
+                    })
+            except UniqueViolation:
+                # Otro usuario guardo el mismo periodo al mismo tiempo: se conserva el suyo
+                return
+        old_attachment = entry.attachment_id
+        wizard.attachment_id.sudo().write({'res_model': self._name, 'res_id': entry.id})
+        entry.write({
+            'version': version,
+            'attachment_id': wizard.attachment_id.id,
+            'file_name': wizard.file_name,
+            'record_count': wizard.record_count,
+            'total_amount': wizard.ir17_total_isr if wizard.report_type == 'ir17' else wizard.total_amount,
+            'total_itbis': wizard.ir17_total_itbis if wizard.report_type == 'ir17' else wizard.total_itbis,
+        })
+        old_attachment.sudo().unlink()
+
+    def unlink(self):
+        self.attachment_id.sudo().unlink()
+        return super().unlink()
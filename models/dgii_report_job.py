@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import AccessError
+from odoo.tools import SQL
+from .dgii_report_writer import DgiiReportWriter
+import logging
+import os
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Facturas procesadas por bloque; cada bloque se confirma (commit) por separado
+JOB_CHUNK = 2000
+# Segundos que una ejecucion del cron dedica a los trabajos antes de ceder
+JOB_TIME_BUDGET = 120
+# Crons que procesan trabajos a la vez; cada uno toma un trabajo distinto
+JOB_WORKER_CRONS = (
+    'l10n_do_ncf.ir_cron_dgii_report_job',
+    'l10n_do_ncf.ir_cron_dgii_report_job_2',
+    'l10n_do_ncf.ir_cron_dgii_report_job_3',
+    'l10n_do_ncf.ir_cron_dgii_report_job_4',
+)
+
+
+class DgiiReportJob(models.Model):
+    _name = 'l10n_do_ncf.dgii.report.job'
+    _description = 'Reporte DGII en Segundo Plano'
+    _inherit = ['mail.thread']
+    _order = 'id desc'
+
+    name = fields.Char(string='Reporte', compute='_compute_name', store=True)
+    company_id = fields.Many2one(
+        'res.company',
+        string='Compania',
+        required=True,
+        readonly=True,
+        default=lambda self: self.env.company
+    )
+    # Solo formatos individuales: el paquete del periodo no se genera en segundo plano
+    report_type = fields.Selection([
+        ('606', '606 - Compras de Bienes y Servicios'),
+        ('607', '607 - Ventas de Bienes y Servicios'),
+        ('608', '608 - Comprobantes Anulados'),
+        ('609', '609 - Pagos al Exterior'),
+        ('ir17', 'IR-17 - Resumen de Retenciones'),
+    ], string='Tipo de Reporte', required=True, readonly=True)
+    date_from = fields.Date(string='Desde', required=True, readonly=True)
+    date_to = fields.Date(string='Hasta', required=True, readonly=True)
+    batch_id = fields.Many2one(
+        'l10n_do_ncf.dgii.report.batch',
+        string='Lote',
+        readonly=True,
+        index='btree_not_null',
+        ondelete='cascade'
+    )
+    user_id = fields.Many2one(
+        'res.users',
+        string='Solicitado por',
+        readonly=True,
+        default=lambda self: self.env.user
+    )
+    state = fields.Selection([
+        ('queued', 'En Cola'),
+        ('running', 'En Proceso'),
+        ('done', 'Terminado'),
+        ('failed', 'Fallido'),
+    ], string='Estado', default='queued', readonly=True, tracking=True)
+
+    record_count = fields.Integer(string='Registros', readonly=True)
+    processed_count = fields.Integer(string='Procesados', readonly=True)
+    progress = fields.Float(string='Progreso', compute='_compute_progress')
+    total_amount = fields.Monetary(string='Monto Total', readonly=True, currency_field='currency_id',
+                                   help='En el IR-17: total de retenciones de ISR')
+    total_itbis = fields.Monetary(string='Total ITBIS', readonly=True, currency_field='currency_id',
+                                  help='En el IR-17: total de retenciones de ITBIS')
+    currency_id = fields.Many2one('res.currency', related='company_id.currency_id')
+
+    # Posicion del trabajo: llave de la ultima factura escrita y estado del archivo parcial
+    last_date = fields.Date(readonly=True)
+    last_id = fields.Integer(readonly=True)
+    file_path = fields.Char(readonly=True)
+    file_offset = fields.Integer(readonly=True)
+    line_count = fields.Integer(readonly=True)
+
+    attachment_id = fields.Many2one('ir.attachment', string='Archivo', readonly=True)
+    file_name = fields.Char(string='Nombre del Archivo', readonly=True)
+    date_done = fields.Datetime(string='Terminado el', readonly=True)
+    error_message = fields.Text(string='Error', readonly=True)
+
+    @api.depends('report_type', 'date_from')
+    def _compute_name(self):
+        for job in self:
+            period = job.date_from.strftime('%Y%m') if job.date_from else ''
+            job.name = f'{job.report_type or ""} {period}'.strip()
+
+    @api.depends('record_count', 'processed_count', 'state')
+    def _compute_progress(self):
+        for job in self:
+            if job.state == 'done':
+                job.progress = 100.0
+            elif job.record_count:
+                job.progress = min(100.0, job.processed_count * 100.0 / job.record_count)
+            else:
+                job.progress = 0.0
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        jobs = super().create(vals_list)
+        self._trigger_workers(len(jobs))
+        return jobs
+
+    def unlink(self):
+        self._remove_partial_file()
+        self.attachment_id.sudo().unlink()
+        return super().unlink()
+
+    def action_retry(self):
+        """Reiniciar un trabajo fallido desde el principio"""
+        failed = self.filtered(lambda j: j.state == 'failed')
+        failed._reset()
+        if failed:
+            # El archivo del lote se vuelve a armar cuando el trabajo termine
+            failed.batch_id.sudo().filtered(lambda b: b.state == 'done').write({'state': 'running'})
+            self._trigger_workers(len(failed))
+        return True
+
+    def action_download(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{self.attachment_id.id}?download=true',
+            'target': 'self',
+        }
+
+    # =====================================================
+    # PROCESAMIENTO
+    # =====================================================
+    @api.model
+    def _trigger_workers(self, count=len(JOB_WORKER_CRONS)):
+        """Despertar hasta ``count`` crons de trabajos"""
+        for xmlid in JOB_WORKER_CRONS[:max(count, 1)]:
+            cron = self.env.ref(xmlid, raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+
+    @api.model
+    def _cron_process_jobs(self):
+        """
+        Procesar trabajos por bloques hasta agotar el tiempo asignado. Cada
+        bloque se confirma, de modo que un worker reiniciado continua desde
+        la ultima factura escrita. Varios crons ejecutan este metodo a la
+        vez: el bloqueo ``SKIP LOCKED`` reparte los trabajos entre ellos.
+        Sin trabajos pendientes, se arman los archivos de los lotes listos.
+        """
+        deadline = time.monotonic() + JOB_TIME_BUDGET
+        while time.monotonic() < deadline:
+            job = self._lock_next_job()
+            if not job:
+                self.env['l10n_do_ncf.dgii.report.batch']._cron_finish_batches()
+                return
+            job._process_step()
+            self.env.cr.commit()
+        # Quedan trabajos pendientes: volver a ejecutar los crons
+        self._trigger_workers()
+
+    @api.model
+    def _lock_next_job(self):
+        """Tomar el trabajo pendiente mas antiguo que nadie este procesando"""
+        self.env.cr.execute(SQL("""
+            SELECT id FROM l10n_do_ncf_dgii_report_job
+            WHERE state IN ('queued', 'running')
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """))
+        row = self.env.cr.fetchone()
+        return self.browse(row[0]) if row else self.browse()
+
+    def _check_report_access(self):
+        """El cron lee por SQL: el solicitante debe tener acceso a la compania del reporte"""
+        self.ensure_one()
+        if self.company_id not in self.user_id.company_ids:
+            raise AccessError(_('%s no tiene acceso a los documentos de la compania %s.') % (
+                self.user_id.name, self.company_id.name))
+
+    def _report_wizard(self):
+        """Asistente en memoria que aporta las consultas y el formato del reporte"""
+        self.ensure_one()
+        return self.env['l10n_do_ncf.dgii.report.wizard'].with_company(self.company_id).new({
+            'company_id': self.company_id.id,
+            'report_type': self.report_type,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+        })
+
+    def _process_step(self):
+        """Ejecutar el siguiente paso del trabajo; los errores lo marcan como fallido"""
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                if self.state == 'queued':
+                    self._start()
+                elif not self.file_path or not os.path.exists(self.file_path):
+                    # El archivo parcial se perdio (por ejemplo, otro servidor): empezar de nuevo
+                    _logger.warning('DGII: archivo parcial perdido para el trabajo %s, se reinicia', self.id)
+                    self._reset()
+                else:
+                    self._process_chunk()
+        except Exception as e:
+            _logger.exception('DGII: fallo el trabajo de reporte %s', self.id)
+            self._fail(str(e))
+
+    def _start(self):
+        """
+        Estimar los registros para el avance y crear el archivo parcial de
+        las lineas. El encabezado se escribe al terminar, con la cantidad de
+        lineas realmente escritas: las facturas confirmadas o canceladas
+        mientras el trabajo corre cambian las filas que se leen.
+        """
+        self._check_report_access()
+        wizard = self._report_wizard()
+        wizard._prepare_report()
+        count = wizard._report_count(wizard._rows_where())
+        writer = DgiiReportWriter(self.env)
+        self.write({
+            'state': 'running',
+            'record_count': count,
+            'file_path': writer.path,
+            'file_offset': writer.close(),
+            'line_count': writer.line_count,
+        })
+
+    def _process_chunk(self):
+        """Escribir el siguiente bloque de facturas; sin facturas, terminar el archivo"""
+        self._check_report_access()
+        wizard = self._report_wizard()
+        where = wizard._rows_where()
+        after = (self.last_date, self.last_id) if self.last_id else None
+        rows = wizard._read_report_rows(where, after=after, limit=JOB_CHUNK)
+        if not rows:
+            self._finish(wizard)
+            return
+        writer = DgiiReportWriter(self.env, self.file_path, self.file_offset, self.line_count)
+
+        total_amount = self.total_amount
+        total_itbis = self.total_itbis
+        for row in rows:
+            line, amount, itbis = wizard._format_report_row(row)
+            total_amount += amount
+            total_itbis += itbis
+            writer.write(line)
+        self.write({
+            'last_date': rows[-1]['invoice_date'],
+            'last_id': rows[-1]['id'],
+            'processed_count': self.processed_count + len(rows),
+            'total_amount': total_amount,
+            'total_itbis': total_itbis,
+            'file_offset': writer.close(),
+            'line_count': writer.line_count,
+        })
+
+    def _finish(self, wizard):
+        """
+        Armar el archivo final (encabezado con las lineas escritas, lineas
+        del archivo parcial y lineas finales), registrar el adjunto y avisar
+        al usuario.
+        """
+        footer = wizard._report_footer_lines(self.processed_count, self.total_amount, self.total_itbis)
+        count = self.processed_count
+        if self.report_type == '608':
+            # Los NCF anulados sin factura van al final y tambien se cuentan
+            count += len(footer)
+        file_name = wizard._report_file_name()
+        with DgiiReportWriter(self.env) as writer:
+            writer.write(wizard._report_header(count))
+            writer.write_file(self.file_path, self.file_offset, self.line_count)
+            writer.write_lines(footer)
+            attachment = writer.save(file_name, self._name, self.id)
+        self._remove_partial_file()
+        self.write({
+            'state': 'done',
+            'record_count': count,
+            'attachment_id': attachment.id,
+            'file_name': file_name,
+            'file_path': False,
+            'date_done': fields.Datetime.now(),
+        })
+        if self.batch_id:
+            # El lote avisa una sola vez, con el ZIP de todos sus reportes
+            return
+        self.message_post(
+            body=_('El reporte %s esta listo: %s registros.') % (self.name, self.record_count),
+            attachment_ids=attachment.ids,
+            partner_ids=self.user_id.partner_id.ids,
+            message_type='comment',
+            subtype_xmlid='mail.mt_comment',
+        )
+
+    def _fail(self, message):
+        self._remove_partial_file()
+        self.write({'state': 'failed', 'error_message': message, 'file_path': False})
+        if self.batch_id:
+            return
+        self.message_post(
+            body=_('No se pudo generar el reporte %s: %s') % (self.name, message),
+            partner_ids=self.user_id.partner_id.ids,
+            message_type='comment',
+            subtype_xmlid='mail.mt_comment',
+        )
+
+    def _reset(self):
+        self._remove_partial_file()
+        self.write({
+            'state': 'queued',
+            'record_count': 0,
+            'processed_count': 0,
+            'total_amount': 0,
+            'total_itbis': 0,
+            'last_date': False,
+            'last_id': 0,
+            'file_path': False,
+            'file_offset': 0,
+            'line_count': 0,
+            'error_message': False,
+        })
+
+    def _remove_partial_file(self):
+        for job in self:
+            if job.file_path and os.path.exists(job.file_path):
+                os.unlink(job.file_path)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Escritura por bloques de los archivos de reportes DGII.
+
+Las lineas se acumulan en un bloque pequeno y se escriben en un archivo
+temporal; al terminar, el archivo se mueve al filestore y se registra como
+``ir.attachment`` sin cargarlo completo en memoria.
+"""
+
+import hashlib
+import os
+import tempfile
+
+# Filas leidas por lote desde la base de datos (cursor del servidor, libro fiscal)
+REPORT_BATCH = 1000
+# Lineas acumuladas antes de escribir al archivo temporal
+CHUNK_LINES = 5000
+
+
+class DgiiReportWriter:
+    """Archivo de texto de un reporte DGII escrito por bloques"""
+
+    def __init__(self, env, path=None, offset=0, line_count=0):
+        """
+        Sin ``path`` se crea un archivo temporal nuevo. Con ``path`` se
+        continua un archivo parcial: se descarta lo escrito despues de
+        ``offset``, que no llego a confirmarse.
+        """
+        self.env = env
+        if path:
+            self.file = open(path, 'r+b')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+            # El checksum se calcula al guardar, leyendo el archivo completo
+            self.sha1 = None
+        else:
+            self.file = tempfile.NamedTemporaryFile(
+                mode='wb', prefix='dgii_', suffix='.txt', dir=temp_directory(env), delete=False
+            )
+            self.sha1 = hashlib.sha1()
+        self.size = offset
+        self.line_count = line_count
+        self._chunk = []
+
+    @property
+    def path(self):
+        return self.file.name
+
+    def write(self, line):
+        """Agregar una linea; el separador se escribe antes de cada linea"""
+        if self.line_count:
+            self._chunk.append('\n')
+        self._chunk.append(line)
+        self.line_count += 1
+        if len(self._chunk) >= CHUNK_LINES * 2:
+            self._flush()
+
+    def write_lines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def write_file(self, path, size, line_count):
+        """
+        Agregar las ``line_count`` lineas de los primeros ``size`` bytes de
+        un archivo escrito por otro ``DgiiReportWriter``, copiandolo por bloques.
+        """
+        if not line_count:
+            return
+        if self.line_count:
+            self._chunk.append('\n')
+        self._flush()
+        with open(path, 'rb') as source:
+            remaining = size
+            while remaining:
+                block = source.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                self.file.write(block)
+                if self.sha1:
+                    self.sha1.update(block)
+                self.size += len(block)
+                remaining -= len(block)
+        self.line_count += line_count
+
+    def _flush(self):
+        if not self._chunk:
+            return
+        data = ''.join(self._chunk).encode('utf-8')
+        self._chunk = []
+        self.file.write(data)
+        if self.sha1:
+            self.sha1.update(data)
+        self.size += len(data)
+
+    def close(self):
+        """
+        Escribir lo pendiente y cerrar el archivo sin registrarlo, para
+        continuarlo despues.
+
+        :return: tamano del archivo en bytes
+        """
+        self._flush()
+        self.file.close()
+        return self.size
+
+    def _checksum(self):
+        return self.sha1.hexdigest() if self.sha1 else file_checksum(self.path)
+
+    def save(self, name, res_model=False, res_id=False):
+        """
+        Cerrar el archivo y registrarlo como adjunto.
+
+        :return: ``ir.attachment`` creado
+        """
+        self.close()
+        return store_file(self.env, self.path, name, res_model=res_model, res_id=res_id,
+                          checksum=self._checksum())
+
+    def discard(self):
+        """Eliminar el archivo temporal si el reporte no se completo"""
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.discard()
+        return False
+
+
+def temp_directory(env):
+    """
+    Directorio para archivos temporales de reportes: el filestore, para
+    moverlos luego sin copiarlos; ``None`` (temporal del sistema) si los
+    adjuntos se guardan en la base de datos.
+    """
+    attachment_model = env['ir.attachment'].sudo()
+    if attachment_model._storage() != 'file':
+        return None
+    directory = attachment_model._filestore()
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def file_checksum(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as report_file:
+        for block in iter(lambda: report_file.read(1024 * 1024), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def store_file(env, path, name, mimetype='text/plain', res_model=False, res_id=False, checksum=None):
+    """
+    Registrar como ``ir.attachment`` un archivo ya escrito en disco. Con
+    almacenamiento en filestore el archivo se mueve, sin leerlo en memoria.
+
+    :return: ``ir.attachment`` creado
+    """
+    attachment_model = env['ir.attachment'].sudo()
+    values = {
+        'name': name,
+        'type': 'binary',
+        'mimetype': mimetype,
+        'res_model': res_model,
+        'res_id': res_id,
+    }
+    if attachment_model._storage() != 'file':
+        # Almacenamiento en base de datos: no hay filestore al cual mover
+        with open(path, 'rb') as stored_file:
+            values['raw'] = stored_file.read()
+        os.unlink(path)
+        return attachment_model.create(values)
+
+    checksum = checksum or file_checksum(path)
+    size = os.path.getsize(path)
+    fname = f'{checksum[:2]}/{checksum}'
+    full_path = attachment_model._full_path(fname)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    if os.path.exists(full_path):
+        os.unlink(path)
+    else:
+        os.replace(path, full_path)
+        # Si la transaccion se revierte, el recolector elimina el archivo
+        attachment_model._mark_for_gc(fname)
+    values.update({
+        'store_fname': fname,
+        'file_size': size,
+        'checksum': checksum,
+    })
+    return attachment_model.create(values)
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+from .dgii_report_writer import REPORT_BATCH
+
+# Reportes que se leen del libro fiscal, con las lineas ya formateadas
+LEDGER_REPORTS = ('606', '607')
+LEDGER_COLUMNS = "SELECT m.id, m.invoice_date, m.line, m.amount, m.itbis"
+LEDGER_FROM = """
+    FROM (
+        SELECT move_id AS id, company_id, report_type, invoice_date, line, amount, itbis
+        FROM l10n_do_ncf_fiscal_ledger
+    ) m
+"""
+
+# Reporte del libro fiscal de cada tipo de factura
+LEDGER_REPORT_BY_MOVE_TYPE = {
+    'in_invoice': '606',
+    'in_refund': '606',
+    'out_invoice': '607',
+    'out_refund': '607',
+}
+# Campos de la factura que se usan en las lineas del 606/607
+LEDGER_MOVE_FIELDS = {
+    'state', 'move_type', 'name', 'ref', 'partner_id', 'invoice_date', 'reversed_entry_id',
+    'l10n_do_expense_type', 'l10n_do_vendor_ncf', 'l10n_do_ncf_number', 'l10n_do_ncf_origin',
+    'l10n_do_ncf_type_id',
+}
+# Campos del contacto que se usan en las lineas del 606/607
+LEDGER_PARTNER_FIELDS = {'vat', 'name', 'is_company', 'country_id'}
+
+
+class FiscalLedger(models.Model):
+    """
+    Una fila por documento fiscal confirmado con su linea del 606 o 607 ya
+    formateada. Confirmar la factura, modificarla, conciliarla, cambiar su
+    estado de pago, sus retenciones o su contacto marcan la fila como
+    desactualizada; antes de cada reporte solo se recalculan las filas
+    marcadas del periodo.
+    """
+    _name = 'l10n_do_ncf.fiscal.ledger'
+    _description = 'Libro Fiscal DGII por Documento'
+    _order = 'invoice_date, move_id'
+    _rec_name = 'move_id'
+
+    move_id = fields.Many2one(
+        'account.move',
+        string='Documento',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    company_id = fields.Many2one('res.company', string='Compania', required=True, readonly=True)
+    report_type = fields.Selection([
+        ('606', '606 - Compras de Bienes y Servicios'),
+        ('607', '607 - Ventas de Bienes y Servicios'),
+    ], string='Reporte', required=True, readonly=True)
+    invoice_date = fields.Date(string='Fecha', readonly=True)
+    line = fields.Char(string='Linea DGII', readonly=True)
+    amount = fields.Float(string='Monto', readonly=True)
+    itbis = fields.Float(string='ITBIS', readonly=True)
+    stale = fields.Boolean(
+        string='Desactualizada',
+        readonly=True,
+        help='La factura o sus datos cambiaron; la linea se recalcula en el proximo reporte'
+    )
+
+    _move_uniq = models.Constraint(
+        'UNIQUE(move_id)',
+        'El documento ya tiene una linea en el libro fiscal.',
+    )
+    _period_idx = models.Index('(company_id, report_type, invoice_date, move_id)')
+
+    @api.model
+    def _sync_moves(self, move_ids):
+        """Reescribir las lineas del libro de las facturas indicadas"""
+        move_ids = list(move_ids)
+        if not move_ids:
+            return
+        self.env.flush_all()
+        self.search([('move_id', 'in', move_ids)]).unlink()
+
+        Wizard = self.env['l10n_do_ncf.dgii.report.wizard']
+        vals_list = []
+        for report_type in LEDGER_REPORTS:
+            wizard = Wizard.new({'report_type': report_type})
+            where = SQL("m.id = ANY(%s) AND %s", move_ids, wizard._report_condition(report_type))
+            rows = wizard._read_move_rows(where)
+            if not rows:
+                continue
+            payments = wizard._get_606_payments(where) if report_type == '606' else {}
+            for row in rows:
+                line, amount, itbis = wizard._format_move_row(row, payments)
+                vals_list.append({
+                    'move_id': row['id'],
+                    'company_id': row['company_id'],
+                    'report_type': report_type,
+                    'invoice_date': row['invoice_date'],
+                    'line': line,
+                    'amount': amount,
+                    'itbis': itbis,
+                })
+        self.create(vals_list)
+
+    @api.model
+    def _refresh_period(self, company, report_type, date_from, date_to):
+        """
+        Recalcular las lineas marcadas de un reporte y periodo. Las facturas
+        que ya no pertenecen al reporte pierden su linea al recalcularse.
+        """
+        self.flush_model()
+        self.env.cr.execute(SQL("""
+            SELECT move_id FROM l10n_do_ncf_fiscal_ledger
+            WHERE company_id = %s AND report_type = %s AND invoice_date BETWEEN %s AND %s AND stale
+        """, company.id, report_type, date_from, date_to))
+        move_ids = [row[0] for row in self.env.cr.fetchall()]
+        for start in range(0, len(move_ids), REPORT_BATCH):
+            self._sync_moves(move_ids[start:start + REPORT_BATCH])
+
+    @api.model
+    def _mark_stale(self, moves):
+        """
+        Marcar para recalculo las lineas de las facturas. Las facturas
+        confirmadas que aun no tienen linea reciben una vacia ya marcada.
+        """
+        moves = moves.filtered(lambda m: m.move_type in LEDGER_REPORT_BY_MOVE_TYPE)
+        if not moves:
+            return
+        self.flush_model()
+        posted = moves.filtered(lambda m: m.state == 'posted' and m.company_id.country_id.code == 'DO')
+        if posted:
+            self.env.cr.execute(SQL("""
+                INSERT INTO l10n_do_ncf_fiscal_ledger
+                    (move_id, company_id, report_type, invoice_date, stale,
+                     create_uid, create_date, write_uid, write_date)
+                SELECT move.id, move.company_id, move.report_type, move.invoice_date, TRUE,
+                       %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+                FROM unnest(%(ids)s, %(companies)s, %(types)s, %(dates)s::date[])
+                     AS move(id, company_id, report_type, invoice_date)
+                ON CONFLICT (move_id) DO UPDATE
+                SET stale = TRUE,
+                    company_id = EXCLUDED.company_id,
+                    report_type = EXCLUDED.report_type,
+                    invoice_date = EXCLUDED.invoice_date,
+                    write_date = EXCLUDED.write_date
+            """,
+                uid=self.env.uid,
+                ids=posted.ids,
+                companies=[move.company_id.id for move in posted],
+                types=[LEDGER_REPORT_BY_MOVE_TYPE[move.move_type] for move in posted],
+                dates=[move.invoice_date or None for move in posted],
+            ))
+        # Solo las facturas confirmadas alguna vez pueden tener linea
+        others = (moves - posted).filtered('posted_before')
+        if others:
+            self.env.cr.execute(SQL("""
+                UPDATE l10n_do_ncf_fiscal_ledger
+                SET stale = TRUE, write_date = NOW() AT TIME ZONE 'UTC'
+                WHERE move_id = ANY(%s) AND NOT stale
+            """, others.ids))
+        self.invalidate_model()
+
+    @api.model
+    def _mark_partners_stale(self, partner_ids):
+        """Marcar para recalculo las lineas de las facturas de los contactos"""
+        self.flush_model()
+        self.env['account.move'].flush_model(['partner_id'])
+        self.env.cr.execute(SQL("""
+            UPDATE l10n_do_ncf_fiscal_ledger l
+            SET stale = TRUE, write_date = NOW() AT TIME ZONE 'UTC'
+            FROM account_move m
+            WHERE m.id = l.move_id AND m.partner_id = ANY(%s) AND NOT l.stale
+        """, list(partner_ids)))
+        self.invalidate_model()
+
+    def init(self):
+        # Facturas confirmadas antes de instalar o actualizar el modulo: lineas vacias ya marcadas
+        self.env.cr.execute("""
+            INSERT INTO l10n_do_ncf_fiscal_ledger
+                (move_id, company_id, report_type, invoice_date, stale,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT m.id, m.company_id,
+                   CASE WHEN m.move_type IN ('in_invoice', 'in_refund') THEN '606' ELSE '607' END,
+                   m.invoice_date, TRUE,
+                   1, NOW() AT TIME ZONE 'UTC', 1, NOW() AT TIME ZONE 'UTC'
+            FROM account_move m
+            JOIN res_company c ON c.id = m.company_id
+            JOIN res_partner cp ON cp.id = c.partner_id
+            JOIN res_country cc ON cc.id = cp.country_id AND cc.code = 'DO'
+            WHERE m.state = 'posted'
+              AND m.move_type IN ('in_invoice', 'in_refund', 'out_invoice', 'out_refund')
+            ON CONFLICT (move_id) DO NOTHING
+        """)
+
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+
+    def write(self, vals):
+        result = super().write(vals)
+        if LEDGER_MOVE_FIELDS.intersection(vals):
+            moves = self
+            if 'l10n_do_vendor_ncf' in vals:
+                # Las notas de credito muestran el NCF de su factura de origen
+                moves |= self.reversal_move_ids
+            self.env['l10n_do_ncf.fiscal.ledger'].sudo()._mark_stale(moves)
+        return result
+
+    def _compute_payment_state(self):
+        # El estado de pago cambia por recalculo, sin write ni conciliacion
+        # nueva: p. ej. de 'in_payment' a 'paid' al conciliar el extracto
+        move_ids = [move_id for move_id in self.ids if isinstance(move_id, int)]
+        previous = {}
+        if move_ids:
+            self.env.cr.execute(SQL(
+                "SELECT id, payment_state FROM account_move WHERE id = ANY(%s)", move_ids,
+            ))
+            previous = dict(self.env.cr.fetchall())
+        super()._compute_payment_state()
+        changed = self.filtered(lambda m: m.id in previous and m.payment_state != previous[m.id])
+        if changed:
+            self.env['l10n_do_ncf.fiscal.ledger'].sudo()._mark_stale(changed)
+
+
+class AccountPartialReconcile(models.Model):
+    _inherit = 'account.partial.reconcile'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        partials = super().create(vals_list)
+        partials._l10n_do_mark_ledger_stale()
+        return partials
+
+    def unlink(self):
+        self._l10n_do_mark_ledger_stale()
+        return super().unlink()
+
+    def _l10n_do_mark_ledger_stale(self):
+        # Pagos y reversos cambian el estado de pago de las facturas conciliadas
+        moves = self.debit_move_id.move_id | self.credit_move_id.move_id
+        self.env['l10n_do_ncf.fiscal.ledger'].sudo()._mark_stale(moves)
+
+
+class AccountMoveRetention(models.Model):
+    _inherit = 'l10n_do_ncf.move.retention'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        retentions = super().create(vals_list)
+        self.env['l10n_do_ncf.fiscal.ledger'].sudo()._mark_stale(retentions.move_id)
+        return retentions
+
+    def write(self, vals):
+        moves = self.move_id
+        result = super().write(vals)
+        self.env['l10n_do_ncf.fiscal.ledger'].sudo()._mark_stale(moves | self.move_id)
+        return result
+
+    def unlink(self):
+        self.env['l10n_do_ncf.fiscal.ledger'].sudo()._mark_stale(self.move_id)
+        return super().unlink()
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    def write(self, vals):
+        result = super().write(vals)
+        if LEDGER_PARTNER_FIELDS.intersection(vals):
+            self.env['l10n_do_ncf.fiscal.ledger'].sudo()._mark_partners_stale(self.ids)
+        return result
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError, ValidationError
 import requests
 import logging
@@ -35,6 +35,54 @@ class NCFLicenseConfig(models.Model):
     last_validation = fields.Datetime(string='Ultima Validacion', readonly=True)
     validation_message = fields.Text(string='Mensaje', readonly=True)
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return records
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_cached_license(self, company_id):
+        """
+        Datos de licencia de la compania, cacheados por proceso.
+        Se invalida al crear, modificar o eliminar una licencia.
+
+        :return: ``(is_valid, status, validation_message, expiration_date)``
+                 o ``None`` si la compania no tiene licencia configurada
+        """
+        config = self.sudo().search([('company_id', '=', company_id)], limit=1)
+        if not config:
+            return None
+        return (config.is_valid, config.status, config.validation_message or '', config.expiration_date)
+
+    @api.model
+    def _get_license_state(self, company_id):
+        """
+        Estado de licencia de la compania sin consultar la base de datos
+        mientras el cache este vigente. La fecha de vencimiento se evalua en
+        cada llamada para que la licencia expire aunque siga en cache.
+
+        :return: ``(configurada, valida, estado, mensaje)``
+        """
+        cached = self._get_cached_license(company_id)
+        if cached is None:
+            return False, False, False, ''
+        is_valid, status, message, expiration_date = cached
+        if is_valid and expiration_date and expiration_date < fields.Date.context_today(self):
+            return True, False, 'expired', _('La licencia vencio el %s.') % expiration_date.strftime('%d/%m/%Y')
+        return True, is_valid, status, message
+
     @api.constrains('company_id')
     def _check_unique_company_license(self):
         for record in self:
@@ -116,10 +164,7 @@ class NCFLicenseConfig(models.Model):
     @api.model
     def is_license_valid(self):
         """Verificar si la licencia de la compania actual es valida"""
-        config = self.search([('company_id', '=', self.env.company.id)], limit=1)
-        if not config:
-            return False
-        return config.is_valid
+        return self._get_license_state(self.env.company.id)[1]
 
     @api.model
     def get_or_create_config(self):
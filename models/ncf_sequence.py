@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError, UserError
+from psycopg2.errors import LockNotAvailable
+from .ncf_sequence_stat import elapsed_ms
 from datetime import date
 import logging
+import random
+import time
 
 _logger = logging.getLogger(__name__)
 
+# Espera exponencial con jitter entre reintentos de bloqueo (modo en cola)
+LOCK_BACKOFF_BASE = 0.05
+LOCK_BACKOFF_MAX = 1.0
+
 
 class NcfSequence(models.Model):
     _name = 'l10n_do_ncf.sequence'
@@ -103,21 +111,55 @@ class NcfSequence(models.Model):
         string='Activo',
         default=True
     )
+    allocation_mode = fields.Selection([
+        ('company', 'Segun Compania'),
+        ('nowait', 'Inmediato (falla si esta ocupada)'),
+        ('wait', 'En cola (espera su turno)'),
+        ('native', 'Secuencia PostgreSQL (sin bloqueo)'),
+    ], string='Modo de Asignacion', default='company', required=True,
+        help='Comportamiento cuando varios usuarios generan NCF de esta secuencia al mismo tiempo'
+    )
+    auto_activate = fields.Boolean(
+        string='Sucesora en Cola',
+        default=False,
+        help='Activar automaticamente esta secuencia cuando se agote la secuencia '
+             'activa del mismo tipo, sin detener la facturacion'
+    )
+
+    _range_no_overlap = models.Constraint(
+        "EXCLUDE USING gist (company_id WITH =, ncf_type_id WITH =, "
+        "int4range(range_from, range_to, '[]') WITH &&) WHERE (range_to >= range_from)",
+        'ERROR: Rango Duplicado o Superpuesto\n\n'
+        'El rango ingresado se solapa con otra secuencia del mismo tipo de NCF.\n\n'
+        'No se permiten rangos duplicados o superpuestos.',
+    )
+
+    def _auto_init(self):
+        # La restriccion de exclusion compara enteros (compania, tipo) con GiST
+        self.env.cr.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        return super()._auto_init()
 
     # =====================================================
     # VALIDACION DE LICENCIA
     # =====================================================
-    @api.model
-    def _check_license_valid(self):
+    def _check_license_valid(self, companies=None):
         """
-        Verificar si la licencia NCF es válida.
-        Método de modelo (no requiere recordset).
+        Verificar si la licencia NCF es válida para ``companies``; por
+        defecto, las companias de las secuencias o, sin recordset, la
+        compania activa.
         """
-        license_config = self.env['l10n_do_ncf.license.config'].sudo().search([
-            ('company_id', '=', self.env.company.id)
-        ], limit=1)
+        for company in companies or self.company_id or self.env.company:
+            self._check_company_license(company)
+        return True
+
+    @api.model
+    def _check_company_license(self, company):
+        """Levantar ``UserError`` si la licencia NCF de ``company`` no es valida"""
+        configured, is_valid, status, message = self.env['l10n_do_ncf.license.config']._get_license_state(
+            company.id
+        )
         
-        if not license_config:
+        if not configured:
             raise UserError(_(
                 'Licencia NCF no configurada.\n\n'
                 'Para crear secuencias NCF debe configurar primero su licencia:\n'
@@ -126,13 +168,13 @@ class NcfSequence(models.Model):
                 '3. Haga clic en "Validar Licencia"'
             ))
         
-        if not license_config.is_valid:
+        if not is_valid:
             raise UserError(_(
                 'Licencia NCF no válida o expirada.\n\n'
                 'Estado: %s\n'
                 '%s\n\n'
                 'Debe renovar su licencia para usar las funciones NCF.'
-            ) % (license_config.status, license_config.validation_message or ''))
+            ) % (status, message))
         
         return True
 
@@ -145,15 +187,27 @@ class NcfSequence(models.Model):
         Validar licencia al crear secuencias.
         Usa @api.model_create_multi según documentación Odoo 19.
         """
-        self._check_license_valid()
-        return super().create(vals_list)
+        self._check_license_valid(self.env['res.company'].browse({
+            vals.get('company_id') or self.env.company.id for vals in vals_list
+        }))
+        records = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return records
 
     def write(self, vals):
         """Validar licencia al modificar campos críticos de secuencias"""
         critical_fields = {'range_from', 'range_to', 'ncf_type_id', 'state'}
         if critical_fields & set(vals.keys()):
             self._check_license_valid()
-        return super().write(vals)
+        result = super().write(vals)
+        if {'state', 'active', 'company_id', 'ncf_type_id'} & set(vals):
+            self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
 
     # =====================================================
     # CAMPOS COMPUTADOS
@@ -224,6 +278,17 @@ class NcfSequence(models.Model):
     @api.depends('current_number', 'range_to', 'range_from', 'expiration_date', 'aplica_vencimiento')
     def _compute_state(self):
         today = date.today()
+        # Estado guardado antes del recalculo: una secuencia activada
+        # manualmente sin numeros usados debe seguir activa.
+        stored_ids = [record_id for record_id in self._ids if isinstance(record_id, int)]
+        activated_ids = set()
+        if stored_ids:
+            self.env.cr.execute(
+                "SELECT id FROM l10n_do_ncf_sequence WHERE id = ANY(%s) AND state = 'active'",
+                (stored_ids,)
+            )
+            activated_ids = {row[0] for row in self.env.cr.fetchall()}
+
         for record in self:
             if record.range_to == 0:
                 record.state = 'draft'
@@ -232,21 +297,10 @@ class NcfSequence(models.Model):
             elif record.current_number > 0 and record.current_number >= record.range_to:
                 record.state = 'depleted'
             elif record.range_to > 0 and record.range_to > record.range_from:
-                if record.current_number > 0:
+                if record.current_number > 0 or record.id in activated_ids:
                     record.state = 'active'
                 else:
-                    if record.id:
-                        self.env.cr.execute(
-                            "SELECT state FROM l10n_do_ncf_sequence WHERE id = %s",
-                            (record.id,)
-                        )
-                        result = self.env.cr.fetchone()
-                        if result and result[0] == 'active':
-                            record.state = 'active'
-                        else:
-                            record.state = 'draft'
-                    else:
-                        record.state = 'draft'
+                    record.state = 'draft'
             else:
                 record.state = 'draft'
 
@@ -259,40 +313,50 @@ class NcfSequence(models.Model):
         if not ncf_type:
             return 0
 
-        prefix = ncf_type.prefix
-
-        last_invoice = self.env['account.move'].search([
-            ('company_id', '=', company_id),
-            ('l10n_do_ncf_number', 'like', prefix + '%'),
-            ('state', '!=', 'cancel'),
-        ], order='l10n_do_ncf_number desc', limit=1)
-
-        if last_invoice and last_invoice.l10n_do_ncf_number:
-            try:
-                ncf = last_invoice.l10n_do_ncf_number
-                num_str = ncf[3:]
-                return int(num_str)
-            except (ValueError, IndexError):
-                pass
-
-        return 0
+        last_number = self.env['l10n_do_ncf.usage.mark']._get_last_number(company_id, ncf_type_id)
+        if last_number is not None:
+            return last_number
 
-    def _check_range_overlap(self, ncf_type_id, company_id, range_from, range_to, exclude_id=None):
-        """Verificar si el rango se solapa con secuencias existentes"""
-        domain = [
-            ('ncf_type_id', '=', ncf_type_id),
-            ('company_id', '=', company_id),
-        ]
-        if exclude_id:
-            domain.append(('id', '!=', exclude_id))
-
-        existing_sequences = self.search(domain)
-
-        for seq in existing_sequences:
-            if range_from <= seq.range_to and range_to >= seq.range_from:
-                return seq
+        # Sin marca de uso: buscar por el indice (compania, serie, secuencial)
+        self.env['account.move'].flush_model(['l10n_do_ncf_prefix', 'l10n_do_ncf_serial', 'state'])
+        self.env.cr.execute("""
+            SELECT MAX(l10n_do_ncf_serial)
+            FROM account_move
+            WHERE company_id = %s
+              AND l10n_do_ncf_prefix = %s
+              AND l10n_do_ncf_serial IS NOT NULL
+              AND state != 'cancel'
+        """, (company_id, ncf_type.prefix))
+        return self.env.cr.fetchone()[0] or 0
+
+    def _get_range_conflicts(self):
+        """
+        Secuencia posterior del mismo tipo para cada registro, en una sola
+        consulta: el nuevo rango haria retroceder la numeracion. Los rangos
+        superpuestos los rechaza antes ``_range_no_overlap`` al escribir.
 
-        return None
+        :return: diccionario {id: secuencia}
+        """
+        records = self.filtered(lambda r: r.id and r.range_to)
+        if not records:
+            return {}
+        self.flush_model(['range_from', 'range_to', 'company_id', 'ncf_type_id'])
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (s.id) s.id, o.id
+            FROM l10n_do_ncf_sequence s
+            JOIN l10n_do_ncf_sequence o
+              ON o.ncf_type_id = s.ncf_type_id
+             AND o.company_id IS NOT DISTINCT FROM s.company_id
+             AND o.id != s.id
+             AND o.range_to > 0
+             AND o.range_to >= s.range_from
+            WHERE s.id = ANY(%s)
+            ORDER BY s.id, o.range_to DESC
+        """, (records.ids,))
+        return {
+            record_id: self.browse(other_id)
+            for record_id, other_id in self.env.cr.fetchall()
+        }
 
     @api.constrains('range_from', 'range_to', 'ncf_type_id', 'company_id')
     def _check_range(self):
@@ -300,36 +364,23 @@ class NcfSequence(models.Model):
             if record.range_from <= 0:
                 raise ValidationError(_('El rango inicial debe ser mayor a 0.'))
 
+            if record.range_to and record.range_to <= record.range_from:
+                raise ValidationError(_('El rango final debe ser mayor al rango inicial.'))
+
+        conflicts = self._get_range_conflicts()
+        last_used_by_type = {}
+
+        for record in self:
             if record.range_to == 0:
                 continue
 
-            if record.range_to <= record.range_from:
-                raise ValidationError(_('El rango final debe ser mayor al rango inicial.'))
-
             tipo_ncf = record.ncf_type_id.prefix if record.ncf_type_id else 'N/A'
+            other = conflicts.get(record.id)
 
-            overlapping = self._check_range_overlap(
-                record.ncf_type_id.id,
-                record.company_id.id,
-                record.range_from,
-                record.range_to,
-                exclude_id=record.id
-            )
-
-            if overlapping:
-                raise ValidationError(_(
-                    'ERROR: Rango Duplicado o Superpuesto [%s]\n\n'
-                    'El rango ingresado (Del %s al %s) se solapa con un rango anterior:\n'
-                    '- Secuencia: %s\n'
-                    '- Rango: Del %s al %s\n\n'
-                    'No se permiten rangos duplicados o superpuestos.'
-                ) % (tipo_ncf, record.range_from, record.range_to, overlapping.name,
-                     overlapping.range_from, overlapping.range_to))
-
-            last_ncf_used = self._get_last_ncf_number_used(
-                record.ncf_type_id.id,
-                record.company_id.id
-            )
+            key = (record.ncf_type_id.id, record.company_id.id)
+            if key not in last_used_by_type:
+                last_used_by_type[key] = self._get_last_ncf_number_used(*key)
+            last_ncf_used = last_used_by_type[key]
 
             if last_ncf_used > 0 and record.range_from <= last_ncf_used:
                 prefix = record.ncf_type_id.prefix
@@ -343,22 +394,15 @@ class NcfSequence(models.Model):
                     '- Rango minimo permitido: %s en adelante'
                 ) % (tipo_ncf, record.range_from, last_ncf_str, last_ncf_used, last_ncf_used + 1))
 
-            max_range = self.search([
-                ('ncf_type_id', '=', record.ncf_type_id.id),
-                ('company_id', '=', record.company_id.id),
-                ('id', '!=', record.id),
-                ('range_to', '>', 0),
-            ], order='range_to desc', limit=1)
-
-            if max_range and record.range_from <= max_range.range_to:
+            if other:
                 raise ValidationError(_(
                     'ERROR: Retroceso de Secuencia No Permitido [%s]\n\n'
                     'El rango inicial (%s) debe ser MAYOR al ultimo rango autorizado.\n\n'
                     '- Ultima secuencia: %s\n'
                     '- Rango anterior: Del %s al %s\n'
                     '- Nuevo rango debe iniciar en: %s o mayor'
-                ) % (tipo_ncf, record.range_from, max_range.name, max_range.range_from,
-                     max_range.range_to, max_range.range_to + 1))
+                ) % (tipo_ncf, record.range_from, other.name, other.range_from,
+                     other.range_to, other.range_to + 1))
 
     # =====================================================
     # ACCIONES
@@ -373,16 +417,9 @@ class NcfSequence(models.Model):
                 raise UserError(_('El rango final debe ser mayor al rango inicial.'))
             record.write({'state': 'active'})
 
-    def get_next_ncf(self):
-        """
-        Obtener el siguiente NCF de forma SEGURA (thread-safe).
-        REQUIERE LICENCIA VALIDA.
-        """
+    def _check_can_issue(self):
+        """Verificar que la secuencia este activa y vigente para emitir NCF"""
         self.ensure_one()
-        
-        # VALIDAR LICENCIA ANTES DE GENERAR NCF
-        self._check_license_valid()
-
         tipo_ncf = self.ncf_type_id.prefix if self.ncf_type_id else 'N/A'
 
         if self.state == 'expired':
@@ -395,73 +432,326 @@ class NcfSequence(models.Model):
         if self.aplica_vencimiento and self.expiration_date and self.expiration_date < date.today():
             raise UserError(_('[%s] Esta secuencia de NCF ha vencido el %s.') % (tipo_ncf, self.expiration_date.strftime('%d/%m/%Y')))
 
-        # BLOQUEO PARA CONCURRENCIA - SELECT FOR UPDATE
-        self.env.cr.execute("""
+    def _format_ncf(self, number):
+        """Formatear un numero de la secuencia como NCF (prefijo + relleno)"""
+        self.ensure_one()
+        width = self.env['l10n_do_ncf.type']._get_serial_width(self.prefix)
+        return f"{self.prefix}{str(number).zfill(width)}"
+
+    # =====================================================
+    # SECUENCIA ACTIVA POR TIPO
+    # =====================================================
+    @api.model
+    @tools.ormcache('company_id', 'ncf_type_id')
+    def _get_active_sequence_id(self, company_id, ncf_type_id):
+        """Id de la secuencia activa mas reciente para (compania, tipo)"""
+        return self.sudo().search([
+            ('company_id', '=', company_id),
+            ('ncf_type_id', '=', ncf_type_id),
+            ('state', '=', 'active'),
+        ], limit=1, order='id desc').id
+
+    @api.model
+    def _get_active_sequences(self, keys):
+        """
+        Resolver la secuencia activa para varios pares (compania, tipo).
+        Una secuencia guardada en cache que ya no esta activa (agotada o
+        vencida por el recalculo del estado) invalida la cache y se busca
+        de nuevo.
+
+        :param keys: iterable de tuplas (company_id, ncf_type_id)
+        :return: diccionario {(company_id, ncf_type_id): secuencia o vacio}
+        """
+        keys = set(keys)
+        result = {key: self.browse(self._get_active_sequence_id(*key)) for key in keys}
+        stale = [key for key, sequence in result.items() if sequence and (
+            sequence.state != 'active' or not sequence.active
+        )]
+        if stale:
+            self.env.registry.clear_cache()
+            for key in stale:
+                result[key] = self.browse(self._get_active_sequence_id(*key))
+        return result
+
+    def _get_allocation_mode(self):
+        """Modo de asignacion efectivo: el de la secuencia o el de la compania"""
+        self.ensure_one()
+        if self.allocation_mode and self.allocation_mode != 'company':
+            return self.allocation_mode
+        return self.company_id.l10n_do_ncf_allocation_mode or 'nowait'
+
+    def _lock_for_allocation(self, mode):
+        """
+        Bloquear la fila de la secuencia para asignar NCF.
+
+        En modo ``nowait`` falla de inmediato si otra transaccion tiene la
+        fila. En modo ``wait`` espera hasta ``lock_timeout`` por intento y
+        reintenta con espera exponencial aleatoria (jitter).
+
+        :return: tupla ``((current_number, range_from, range_to), ms_espera)``
+        """
+        self.ensure_one()
+        query = """
             SELECT current_number, range_from, range_to
             FROM l10n_do_ncf_sequence
             WHERE id = %s
-            FOR UPDATE NOWAIT
-        """, (self.id,))
+            FOR UPDATE
+        """
+        if mode != 'wait':
+            try:
+                self.env.cr.execute(query + " NOWAIT", (self.id,))
+            except LockNotAvailable:
+                self.env['l10n_do_ncf.sequence.stat']._record(self.id, nowait_failures=1)
+                raise
+            return self.env.cr.fetchone(), 0
+
+        tipo_ncf = self.ncf_type_id.prefix if self.ncf_type_id else 'N/A'
+        timeout = '%dms' % max(self.company_id.l10n_do_ncf_lock_timeout, 1)
+        retries = max(self.company_id.l10n_do_ncf_lock_retries, 0)
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                with self.env.cr.savepoint(flush=False):
+                    self.env.cr.execute(
+                        "SELECT current_setting('lock_timeout'), set_config('lock_timeout', %s, true)",
+                        (timeout,)
+                    )
+                    previous_timeout = self.env.cr.fetchone()[0]
+                    self.env.cr.execute(query, (self.id,))
+                    result = self.env.cr.fetchone()
+                    self.env.cr.execute(
+                        "SELECT set_config('lock_timeout', %s, true)", (previous_timeout,)
+                    )
+                break
+            except LockNotAvailable:
+                attempt += 1
+                if attempt > retries:
+                    waited_ms = int((time.monotonic() - start) * 1000)
+                    self.env['l10n_do_ncf.sequence.stat']._record(
+                        self.id, wait_timeouts=1, lock_ms=waited_ms, lock_max_ms=waited_ms
+                    )
+                    _logger.warning(
+                        'NCF: secuencia %s ocupada, se agotaron %s reintentos (%s ms)',
+                        self.name, retries, waited_ms
+                    )
+                    raise UserError(_(
+                        '[%s] La secuencia NCF esta ocupada por otro usuario.\n'
+                        'Se espero %s ms sin obtener turno. Por favor intente de nuevo.'
+                    ) % (tipo_ncf, waited_ms))
+                backoff = min(LOCK_BACKOFF_MAX, LOCK_BACKOFF_BASE * 2 ** attempt)
+                time.sleep(random.uniform(0, backoff))
+
+        waited_ms = int((time.monotonic() - start) * 1000)
+        if attempt:
+            _logger.info('NCF: turno obtenido en secuencia %s tras %s reintentos (%s ms)',
+                         self.name, attempt, waited_ms)
+        return result, waited_ms
+
+    def get_next_ncf(self):
+        """
+        Obtener el siguiente NCF de forma SEGURA (thread-safe).
+        REQUIERE LICENCIA VALIDA.
+        """
+        return self.get_next_ncf_block(1)[0]
+
+    def get_next_ncf_block(self, count):
+        """
+        Reservar ``count`` NCF de forma SEGURA (thread-safe).
+        El bloqueo y la actualizacion del contador se hacen una sola vez
+        para todo el bloque. Si el rango se agota, se continua con la
+        secuencia sucesora en cola.
+        REQUIERE LICENCIA VALIDA.
+
+        :param int count: cantidad de NCF a reservar
+        :return: lista de NCF formateados, en orden ascendente
+        """
+        return [ncf for sequence, ncfs in self._reserve_ncf_segments(count) for ncf in ncfs]
+
+    def _reserve_ncf_segments(self, count):
+        """
+        Reservar ``count`` NCF pasando a la secuencia sucesora cuando se
+        alcanza ``range_to``, dentro de la misma transaccion.
+
+        :return: lista de tuplas ``(secuencia, lista_de_ncf)``, en orden
+        """
+        self.ensure_one()
+        segments = []
+        sequence = self
+        while True:
+            numbers, ncfs = sequence._reserve_ncf_block(count, partial=True)
+            if ncfs:
+                segments.append((sequence, ncfs))
+                count -= len(ncfs)
+
+            successor = self.browse()
+            if not numbers or numbers[-1] >= sequence.range_to:
+                successor = sequence._activate_successor()
+
+            if not count:
+                self.env['l10n_do_ncf.sequence.stat']._flush_pending()
+                return segments
+            if not successor:
+                # Sin sucesora: se reporta el agotamiento con su detalle
+                numbers, ncfs = sequence._reserve_ncf_block(count)
+                segments.append((sequence, ncfs))
+                return segments
+            sequence = successor
+
+    def _activate_successor(self):
+        """
+        Marcar la secuencia como agotada y activar la siguiente del mismo
+        tipo: una ya activa o la primera sucesora en cola. La fila de la
+        sucesora queda bloqueada para que dos transacciones no la activen
+        a la vez.
+
+        :return: secuencia sucesora, o vacio si no hay ninguna
+        """
+        self.ensure_one()
+        self.env.cr.execute("""
+            SELECT id, state FROM l10n_do_ncf_sequence
+            WHERE company_id = %s
+              AND ncf_type_id = %s
+              AND id != %s
+              AND active
+              AND range_from > %s
+              AND range_to > range_from
+              AND (state = 'active' OR (state = 'draft' AND auto_activate))
+              AND (NOT COALESCE(aplica_vencimiento, FALSE)
+                   OR expiration_date IS NULL OR expiration_date >= %s)
+            ORDER BY range_from
+            LIMIT 1
+            FOR UPDATE
+        """, (self.company_id.id, self.ncf_type_id.id, self.id, self.range_to, date.today()))
+        row = self.env.cr.fetchone()
+        if not row:
+            return self.browse()
+
+        successor_id, successor_state = row
+        self.env.cr.execute("""
+            UPDATE l10n_do_ncf_sequence
+            SET state = CASE WHEN id = %s THEN 'depleted' ELSE 'active' END,
+                write_date = NOW(), write_uid = %s
+            WHERE id IN %s
+        """, (self.id, self.env.uid, (self.id, successor_id)))
+        successor = self.browse(successor_id)
+        (self + successor).invalidate_recordset(['state'])
+        self.env.registry.clear_cache()
+        if successor_state == 'draft':
+            _logger.info('NCF: secuencia %s agotada, se activo la sucesora %s', self.name, successor.name)
+        return successor
+
+    def _reserve_ncf_block(self, count, partial=False):
+        """
+        Reservar ``count`` numeros de la secuencia segun su modo de asignacion.
+        Con ``partial`` se reservan solo los que quedan en el rango (puede
+        ser ninguno) en lugar de fallar por agotamiento.
+
+        :return: tupla ``(lista_de_numeros, lista_de_ncf)``
+        """
+        self.ensure_one()
+
+        # VALIDAR LICENCIA ANTES DE GENERAR NCF
+        start = time.perf_counter()
+        self._check_license_valid()
+        license_ms = elapsed_ms(start)
+
+        tipo_ncf = self.ncf_type_id.prefix if self.ncf_type_id else 'N/A'
+
+        if count < 1:
+            raise UserError(_('[%s] La cantidad de NCF a reservar debe ser mayor a 0.') % tipo_ncf)
+
+        self._check_can_issue()
+
+        mode = self._get_allocation_mode()
+        if mode == 'native':
+            numbers = self._reserve_native_numbers(count, partial=partial)
+        else:
+            numbers = self._reserve_counter_numbers(count, mode, partial=partial)
+
+        if not numbers:
+            return [], []
+
+        self.env['l10n_do_ncf.sequence.stat']._record(
+            self.id, allocation_count=1, numbers_issued=len(numbers), license_ms=license_ms
+        )
+
+        if mode != 'native':
+            self.env['l10n_do_ncf.usage.mark']._bump(self.company_id.id, self.ncf_type_id.id, numbers[-1])
+
+        # Formatear NCF. Los duplicados los rechaza el indice unico de
+        # account_move al asignar el NCF a la factura.
+        ncfs = [self._format_ncf(num) for num in numbers]
 
-        result = self.env.cr.fetchone()
+        if len(ncfs) == 1:
+            _logger.info('NCF generado: %s (secuencia: %s)', ncfs[0], self.name)
+        else:
+            _logger.info('NCF generados: %s a %s [%s] (secuencia: %s)',
+                         ncfs[0], ncfs[-1], len(ncfs), self.name)
+
+        return numbers, ncfs
+
+    def _reserve_counter_numbers(self, count, mode, partial=False):
+        """
+        Reservar ``count`` numeros contiguos avanzando ``current_number``
+        bajo bloqueo de la fila de la secuencia. Con ``partial`` se
+        reservan solo los numeros que quedan en el rango.
+        """
+        tipo_ncf = self.ncf_type_id.prefix if self.ncf_type_id else 'N/A'
+
+        # BLOQUEO PARA CONCURRENCIA - SELECT FOR UPDATE
+        Stat = self.env['l10n_do_ncf.sequence.stat']
+        start = time.perf_counter()
+        result, waited_ms = self._lock_for_allocation(mode)
+        lock_ms = elapsed_ms(start)
+        Stat._record(self.id, lock_ms=lock_ms, lock_max_ms=lock_ms)
+        if mode == 'wait':
+            Stat._record(self.id, lock_wait_count=1, lock_wait_ms=waited_ms)
         if not result:
             raise UserError(_('[%s] Error al obtener la secuencia NCF.') % tipo_ncf)
 
         current_number, range_from, range_to = result
 
         if current_number == 0:
-            next_num = range_from
+            first_num = range_from
         else:
-            next_num = current_number + 1
-
-        if next_num > range_to:
+            first_num = current_number + 1
+        last_num = first_num + count - 1
+
+        if last_num > range_to and partial:
+            last_num = range_to
+            if last_num < first_num:
+                return []
+        elif last_num > range_to:
             raise UserError(_(
                 '[%s] Se ha agotado la secuencia de NCF.\n\n'
                 'Rango autorizado: %s - %s\n'
-                'Ultimo usado: %s\n\n'
+                'Ultimo usado: %s\n'
+                'Solicitados: %s - Disponibles: %s\n\n'
                 'Debe solicitar una nueva secuencia a la DGII.'
-            ) % (tipo_ncf, range_from, range_to, current_number))
-
-        # Formatear NCF
-        if self.ncf_type_id.is_electronic:
-            ncf = f"{self.prefix}{str(next_num).zfill(10)}"
-        else:
-            ncf = f"{self.prefix}{str(next_num).zfill(8)}"
-
-        # VALIDACION: Verificar que este NCF no exista ya
-        existing = self.env['account.move'].search([
-            ('l10n_do_ncf_number', '=', ncf),
-            ('company_id', '=', self.company_id.id),
-            ('state', '!=', 'cancel'),
-        ], limit=1)
-
-        if existing:
-            raise UserError(_(
-                'ERROR CRITICO: NCF Duplicado Detectado [%s]\n\n'
-                'El NCF %s ya existe en la factura %s.\n\n'
-                'Contacte al administrador del sistema.'
-            ) % (tipo_ncf, ncf, existing.name))
+            ) % (tipo_ncf, range_from, range_to, current_number,
+                 count, max(range_to - first_num + 1, 0)))
 
         # ACTUALIZAR con SQL directo para atomicidad
+        start = time.perf_counter()
         self.env.cr.execute("""
             UPDATE l10n_do_ncf_sequence
             SET current_number = %s, write_date = NOW(), write_uid = %s
             WHERE id = %s AND current_number = %s
             RETURNING id
-        """, (next_num, self.env.uid, self.id, current_number))
+        """, (last_num, self.env.uid, self.id, current_number))
 
         updated = self.env.cr.fetchone()
+        Stat._record(self.id, update_ms=elapsed_ms(start))
         if not updated:
+            Stat._record(self.id, conflicts=1)
             raise UserError(_(
                 '[%s] Error de concurrencia: Otro usuario genero un NCF al mismo tiempo.\n'
                 'Por favor intente de nuevo.'
             ) % tipo_ncf)
 
         self.invalidate_recordset(['current_number'])
-
-        _logger.info('NCF generado: %s (secuencia: %s)', ncf, self.name)
-
-        return ncf
+        return list(range(first_num, last_num + 1))
 
     def action_view_invoices(self):
         """Ver facturas que usan esta secuencia"""
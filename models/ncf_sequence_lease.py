@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import AccessError, UserError, ValidationError
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Vigencia por defecto de un bloque arrendado a una terminal
+DEFAULT_LEASE_HOURS = 24
+
+
+class NcfSequenceLease(models.Model):
+    _name = 'l10n_do_ncf.sequence.lease'
+    _description = 'Arrendamiento de Bloque NCF'
+    _order = 'id desc'
+
+    name = fields.Char(
+        string='Nombre',
+        compute='_compute_name',
+        store=True
+    )
+    sequence_id = fields.Many2one(
+        'l10n_do_ncf.sequence',
+        string='Secuencia NCF',
+        required=True,
+        readonly=True,
+        ondelete='restrict'
+    )
+    company_id = fields.Many2one(
+        'res.company',
+        string='Compania',
+        related='sequence_id.company_id',
+        store=True
+    )
+    ncf_type_id = fields.Many2one(
+        'l10n_do_ncf.type',
+        string='Tipo de NCF',
+        related='sequence_id.ncf_type_id',
+        store=True
+    )
+    holder = fields.Char(
+        string='Terminal',
+        readonly=True,
+        help='Terminal o proceso que tiene el bloque arrendado'
+    )
+    user_id = fields.Many2one(
+        'res.users',
+        string='Usuario',
+        readonly=True,
+        default=lambda self: self.env.user
+    )
+    number_from = fields.Integer(
+        string='Desde',
+        required=True,
+        readonly=True
+    )
+    number_to = fields.Integer(
+        string='Hasta',
+        required=True,
+        readonly=True
+    )
+    last_used = fields.Integer(
+        string='Ultimo Usado',
+        default=0,
+        readonly=True,
+        help='Ultimo numero del bloque reportado como emitido por la terminal'
+    )
+    expiration = fields.Datetime(
+        string='Vence',
+        readonly=True
+    )
+    unused_policy = fields.Selection([
+        ('return', 'Devolver a la Secuencia'),
+        ('void', 'Anular (Reporte 608)'),
+    ], string='Numeros no Usados', default='return', required=True,
+        help='Que hacer con los numeros no emitidos al cerrar o vencer el arrendamiento')
+    state = fields.Selection([
+        ('open', 'Abierto'),
+        ('available', 'Disponible para Re-arrendar'),
+        ('closed', 'Cerrado'),
+        ('expired', 'Vencido'),
+    ], string='Estado', default='open', required=True, readonly=True)
+    leased_qty = fields.Integer(
+        string='Arrendados',
+        compute='_compute_quantities',
+        store=True
+    )
+    used_qty = fields.Integer(
+        string='Usados',
+        compute='_compute_quantities',
+        store=True
+    )
+    remaining_qty = fields.Integer(
+        string='Sin Usar',
+        compute='_compute_quantities',
+        store=True
+    )
+    returned_qty = fields.Integer(string='Devueltos', readonly=True)
+    voided_qty = fields.Integer(string='Anulados', readonly=True)
+    closed_date = fields.Datetime(string='Fecha de Cierre', readonly=True)
+
+    @api.depends('sequence_id.prefix', 'number_from', 'number_to')
+    def _compute_name(self):
+        for lease in self:
+            lease.name = f"{lease.sequence_id.prefix or ''} ({lease.number_from}-{lease.number_to})"
+
+    @api.depends('number_from', 'number_to', 'last_used')
+    def _compute_quantities(self):
+        for lease in self:
+            lease.leased_qty = lease.number_to - lease.number_from + 1
+            lease.used_qty = lease.last_used - lease.number_from + 1 if lease.last_used else 0
+            lease.remaining_qty = lease.leased_qty - lease.used_qty
+
+    @api.constrains('number_from', 'number_to', 'last_used')
+    def _check_numbers(self):
+        for lease in self:
+            if lease.number_to < lease.number_from:
+                raise ValidationError(_('El rango arrendado no es valido.'))
+            if lease.last_used and not lease.number_from <= lease.last_used <= lease.number_to:
+                raise ValidationError(_('El ultimo numero usado debe estar dentro del rango arrendado.'))
+
+    def _get_next_number(self):
+        self.ensure_one()
+        return self.last_used + 1 if self.last_used else self.number_from
+
+    def _get_terminal_payload(self):
+        """Datos que necesita la terminal para emitir NCF sin conexion"""
+        self.ensure_one()
+        sequence = self.sequence_id
+        return {
+            'lease_id': self.id,
+            'prefix': sequence.prefix,
+            'number_from': self.number_from,
+            'number_to': self.number_to,
+            'first_ncf': sequence._format_ncf(self.number_from),
+            'last_ncf': sequence._format_ncf(self.number_to),
+            'expiration': fields.Datetime.to_string(self.expiration),
+        }
+
+    def _check_holder_access(self):
+        """
+        Los usuarios de facturacion solo leen los arrendamientos: el uso y
+        el cierre los registra el usuario que arrendo el bloque o un
+        administrador contable, y se escriben con sudo.
+        """
+        self.check_access('read')
+        if not self.env.user.has_group('account.group_account_manager'):
+            foreign = self.filtered(lambda lease: lease.user_id != self.env.user)
+            if foreign:
+                raise AccessError(_('El arrendamiento %s pertenece a otro usuario.') % foreign[0].name)
+
+    def register_usage(self, last_number):
+        """
+        Registrar el ultimo numero emitido por la terminal.
+        La terminal lo reporta al sincronizar; no requiere bloqueo de la secuencia.
+        """
+        self.ensure_one()
+        self._check_holder_access()
+        if self.state != 'open':
+            raise UserError(_('El arrendamiento %s no esta abierto.') % self.name)
+        if not self.number_from <= last_number <= self.number_to:
+            raise UserError(_(
+                'El numero %s esta fuera del bloque arrendado (%s - %s).'
+            ) % (last_number, self.number_from, self.number_to))
+        if last_number < self.last_used:
+            raise UserError(_(
+                'El numero %s es menor al ultimo reportado (%s).'
+            ) % (last_number, self.last_used))
+        self.sudo().write({'last_used': last_number})
+        return True
+
+    def action_close(self):
+        """Cerrar el arrendamiento y conciliar los numeros no usados"""
+        self._check_holder_access()
+        for lease in self.filtered(lambda l: l.state == 'open'):
+            lease.sudo()._reconcile_unused('closed')
+        return True
+
+    def _reconcile_unused(self, final_state):
+        """Devolver o anular los numeros del bloque que la terminal no emitio"""
+        self.ensure_one()
+        first = self._get_next_number()
+        last = self.number_to
+        returned = voided = 0
+
+        if first <= last:
+            if self.unused_policy == 'void':
+                self.env['l10n_do_ncf.voided']._void_numbers(
+                    self.sequence_id, list(range(first, last + 1)), 'lease', lease=self,
+                    note=_('No emitido por la terminal %s') % (self.holder or ''),
+                )
+                voided = last - first + 1
+            else:
+                self.sequence_id._return_leased_numbers(first, last)
+                returned = last - first + 1
+
+        self.write({
+            'state': final_state,
+            'returned_qty': returned,
+            'voided_qty': voided,
+            'closed_date': fields.Datetime.now(),
+        })
+        _logger.info('NCF: arrendamiento %s conciliado (%s devueltos, %s anulados)',
+                     self.name, returned, voided)
+
+    @api.model
+    def _cron_expire_leases(self):
+        """Conciliar arrendamientos vencidos y anular remanentes de secuencias cerradas"""
+        expired = self.search([
+            ('state', '=', 'open'),
+            ('expiration', '<', fields.Datetime.now()),
+        ])
+        for lease in expired:
+            lease._reconcile_unused('expired')
+
+        today = fields.Date.context_today(self)
+        stale_pool = self.search([('state', '=', 'available')]).filtered(
+            lambda l: l.sequence_id.state in ('depleted', 'expired') or (
+                l.sequence_id.aplica_vencimiento and l.sequence_id.expiration_date
+                and l.sequence_id.expiration_date < today
+            )
+        )
+        for lease in stale_pool:
+            lease.unused_policy = 'void'
+            lease._reconcile_unused('closed')
+
+
+class NcfSequence(models.Model):
+    _inherit = 'l10n_do_ncf.sequence'
+
+    lease_ids = fields.One2many(
+        'l10n_do_ncf.sequence.lease',
+        'sequence_id',
+        string='Arrendamientos'
+    )
+    leased_open_qty = fields.Integer(
+        string='En Terminales',
+        compute='_compute_lease_quantities',
+        help='Numeros arrendados a terminales que aun no han sido emitidos'
+    )
+    lease_available_qty = fields.Integer(
+        string='Devueltos por Re-arrendar',
+        compute='_compute_lease_quantities',
+        help='Numeros devueltos por terminales, disponibles para un nuevo arrendamiento'
+    )
+
+    @api.depends('lease_ids.state', 'lease_ids.remaining_qty')
+    def _compute_lease_quantities(self):
+        for record in self:
+            leases = record.lease_ids
+            record.leased_open_qty = sum(leases.filtered(lambda l: l.state == 'open').mapped('remaining_qty'))
+            record.lease_available_qty = sum(leases.filtered(lambda l: l.state == 'available').mapped('remaining_qty'))
+
+    def lease_ncf_block(self, count, holder, hours=None, unused_policy='return'):
+        """
+        Arrendar un bloque de NCF a una terminal.
+
+        Primero se re-arriendan numeros devueltos por otras terminales; si no
+        hay, se reserva un bloque nuevo con ``_reserve_ncf_block``. La
+        terminal emite los NCF localmente y reporta el uso con
+        ``register_usage``. Si el remanente devuelto es menor a ``count``,
+        el bloque entregado es mas pequeno que el solicitado.
+
+        :return: diccionario con el rango y vencimiento del arrendamiento
+        """
+        self.ensure_one()
+        if count < 1:
+            raise UserError(_('La cantidad de NCF a arrendar debe ser mayor a 0.'))
+
+        if self._get_allocation_mode() == 'native':
+            raise UserError(_(
+                'La secuencia %s usa asignacion por secuencia PostgreSQL, '
+                'que no garantiza bloques contiguos. No se puede arrendar.'
+            ) % self.name)
+
+        Lease = self.env['l10n_do_ncf.sequence.lease']
+        self.env.cr.execute("""
+            SELECT id FROM l10n_do_ncf_sequence_lease
+            WHERE sequence_id = %s AND state = 'available'
+            ORDER BY number_from
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """, (self.id,))
+        row = self.env.cr.fetchone()
+
+        if row:
+            self._check_license_valid()
+            self._check_can_issue()
+            pool = Lease.browse(row[0])
+            first = pool.number_from
+            last = min(first + count - 1, pool.number_to)
+            if last == pool.number_to:
+                pool.sudo().unlink()
+            else:
+                pool.sudo().write({'number_from': last + 1})
+        else:
+            numbers = self._reserve_ncf_block(count)[0]
+            first, last = numbers[0], numbers[-1]
+
+        lease = Lease.sudo().create({
+            'sequence_id': self.id,
+            'holder': holder,
+            'user_id': self.env.uid,
+            'number_from': first,
+            'number_to': last,
+            'expiration': fields.Datetime.now() + timedelta(hours=hours or DEFAULT_LEASE_HOURS),
+            'unused_policy': unused_policy,
+        })
+        _logger.info('NCF: bloque %s arrendado a %s', lease.name, holder)
+        return lease._get_terminal_payload()
+
+    def _return_leased_numbers(self, first, last):
+        """
+        Devolver numeros no usados de un arrendamiento.
+        Si el bloque es el ultimo asignado, el contador retrocede; si no,
+        el rango queda disponible para un nuevo arrendamiento.
+        """
+        self.ensure_one()
+        self.env.cr.execute("""
+            SELECT current_number, range_from
+            FROM l10n_do_ncf_sequence
+            WHERE id = %s
+            FOR UPDATE
+        """, (self.id,))
+        current_number, range_from = self.env.cr.fetchone()
+
+        if current_number == last:
+            new_current = first - 1 if first > range_from else 0
+            self.env.cr.execute("""
+                UPDATE l10n_do_ncf_sequence
+                SET current_number = %s, write_date = NOW(), write_uid = %s
+                WHERE id = %s
+            """, (new_current, self.env.uid, self.id))
+            self.invalidate_recordset(['current_number'])
+        else:
+            self.env['l10n_do_ncf.sequence.lease'].sudo().create({
+                'sequence_id': self.id,
+                'holder': False,
+                'number_from': first,
+                'number_to': last,
+                'state': 'available',
+            })
+
+    def action_view_leases(self):
+        """Ver arrendamientos de esta secuencia"""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Arrendamientos'),
+            'res_model': 'l10n_do_ncf.sequence.lease',
+            'view_mode': 'list,form',
+            'domain': [('sequence_id', '=', self.id)],
+            'context': {'default_sequence_id': self.id},
+        }
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import SQL
+from psycopg2.errors import SequenceGeneratorLimitExceeded
+from .ncf_sequence_stat import elapsed_ms
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class NcfSequence(models.Model):
+    _inherit = 'l10n_do_ncf.sequence'
+
+    native_reconciled_upto = fields.Integer(
+        string='Conciliado Hasta',
+        default=0,
+        readonly=True,
+        help='Ultimo numero verificado contra facturas y anulaciones (modo PostgreSQL)'
+    )
+    native_pending_upto = fields.Integer(
+        string='Pendiente de Conciliar Hasta',
+        default=0,
+        readonly=True,
+        help='Ultimo numero entregado por PostgreSQL en la conciliacion anterior. '
+             'Se concilia en la siguiente ejecucion para dar tiempo a que las '
+             'transacciones en curso confirmen sus facturas.'
+    )
+
+    # =====================================================
+    # SECUENCIA POSTGRESQL
+    # =====================================================
+    def _native_sequence_name(self):
+        self.ensure_one()
+        return f'l10n_do_ncf_sequence_native_{self.id}'
+
+    def _native_sequence_exists(self):
+        self.ensure_one()
+        self.env.cr.execute("SELECT to_regclass(%s)", (self._native_sequence_name(),))
+        return bool(self.env.cr.fetchone()[0])
+
+    def _native_ensure(self):
+        """Crear o ajustar la secuencia PostgreSQL al rango autorizado"""
+        for record in self:
+            if not record.range_to or record.range_to <= record.range_from:
+                continue
+            name = SQL.identifier(record._native_sequence_name())
+            if record._native_sequence_exists():
+                record.env.cr.execute(SQL(
+                    "ALTER SEQUENCE %s MINVALUE %s MAXVALUE %s",
+                    name, record.range_from, record.range_to,
+                ))
+            else:
+                start = record.current_number + 1 if record.current_number else record.range_from
+                record.env.cr.execute(SQL(
+                    "CREATE SEQUENCE %s INCREMENT 1 MINVALUE %s MAXVALUE %s START %s NO CYCLE",
+                    name, record.range_from, record.range_to, start,
+                ))
+                _logger.info('NCF: secuencia PostgreSQL creada para %s (inicio %s)', record.name, start)
+
+    def _native_drop(self):
+        for record in self:
+            record.env.cr.execute(SQL(
+                "DROP SEQUENCE IF EXISTS %s", SQL.identifier(record._native_sequence_name())
+            ))
+
+    def _native_last_value(self):
+        """Ultimo numero entregado por la secuencia PostgreSQL (0 si ninguno)"""
+        self.ensure_one()
+        self.env.cr.execute(SQL(
+            "SELECT last_value, is_called FROM %s", SQL.identifier(self._native_sequence_name())
+        ))
+        last_value, is_called = self.env.cr.fetchone()
+        if is_called:
+            return last_value
+        return last_value - 1 if last_value > self.range_from else 0
+
+    def _reserve_native_numbers(self, count, partial=False):
+        """
+        Reservar ``count`` numeros con ``nextval()``, sin bloquear la fila.
+        Los numeros no son necesariamente contiguos si hay otras
+        transacciones asignando al mismo tiempo, y un ``nextval()`` no se
+        revierte con la transaccion: los numeros perdidos se anulan en la
+        conciliacion.
+
+        La cantidad se limita a lo que queda del rango antes de llamar a
+        ``nextval()``, como en el modo contador: un ``nextval()`` que pasa
+        de ``range_to`` falla y deja consumidos (y luego anulados) los
+        numeros autorizados que pidio antes. Con ``partial`` se devuelven
+        los que quedan (puede ser ninguno); sin ``partial``, si no alcanzan
+        se rechaza la reserva sin consumir ninguno.
+        """
+        self.ensure_one()
+        if not self._native_sequence_exists():
+            self._native_ensure()
+        start = time.perf_counter()
+        issued_upto = max(self._native_last_value(), self.range_from - 1)
+        available = max(self.range_to - issued_upto, 0)
+        if available < count and not partial:
+            self._raise_native_depleted(count, available)
+        count = min(count, available)
+        if not count:
+            return []
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute(
+                    "SELECT nextval(%s::regclass) FROM generate_series(1, %s)",
+                    (self._native_sequence_name(), count)
+                )
+                numbers = [row[0] for row in self.env.cr.fetchall()]
+        except SequenceGeneratorLimitExceeded:
+            # Otra transaccion tomo el final del rango entre la lectura y nextval()
+            if partial:
+                return []
+            self._raise_native_depleted(count, 0)
+        self.env['l10n_do_ncf.sequence.stat']._record(self.id, update_ms=elapsed_ms(start))
+        return numbers
+
+    def _raise_native_depleted(self, count, available):
+        tipo_ncf = self.ncf_type_id.prefix if self.ncf_type_id else 'N/A'
+        raise UserError(_(
+            '[%s] Se ha agotado la secuencia de NCF.\n\n'
+            'Rango autorizado: %s - %s\n'
+            'Solicitados: %s - Disponibles: %s\n\n'
+            'Debe solicitar una nueva secuencia a la DGII.'
+        ) % (tipo_ncf, self.range_from, self.range_to, count, available))
+
+    def _native_sync_current_number(self):
+        """Copiar a current_number el ultimo valor entregado por PostgreSQL"""
+        for record in self:
+            if not record._native_sequence_exists():
+                continue
+            last_value = record._native_last_value()
+            record.env.cr.execute("""
+                UPDATE l10n_do_ncf_sequence
+                SET current_number = GREATEST(current_number, %s)
+                WHERE id = %s
+            """, (last_value, record.id))
+            record.invalidate_recordset(['current_number'])
+            record.modified(['current_number'])
+            if last_value:
+                record.env['l10n_do_ncf.usage.mark']._bump(
+                    record.company_id.id, record.ncf_type_id.id, last_value
+                )
+
+    def _native_reconcile(self):
+        """
+        Anular (608) los numeros entregados por PostgreSQL que no llegaron a
+        ninguna factura, anulacion o arrendamiento, por ejemplo porque la
+        transaccion que los pidio fue revertida.
+
+        Solo se concilia hasta el valor observado en la ejecucion anterior,
+        de modo que las transacciones que estaban en curso ya terminaron.
+        """
+        Voided = self.env['l10n_do_ncf.voided']
+        for record in self:
+            if not record._native_sequence_exists():
+                continue
+            last_value = record._native_last_value()
+            start = max(record.native_reconciled_upto + 1, record.range_from)
+            end = record.native_pending_upto
+            burned = []
+            if end >= start:
+                width = record.env['l10n_do_ncf.type']._get_serial_width(record.prefix)
+                record.env.cr.execute("""
+                    SELECT n FROM generate_series(%(start)s, %(end)s) AS n
+                    WHERE NOT EXISTS (
+                        -- Indice (compania, prefijo, serie); una factura cancelada no usa el numero
+                        SELECT 1 FROM account_move m
+                        WHERE m.company_id = %(company)s
+                          AND m.l10n_do_ncf_prefix = %(prefix)s
+                          AND m.l10n_do_ncf_serial = n
+                          AND m.state != 'cancel'
+                    )
+                    AND NOT EXISTS (
+                        SELECT 1 FROM l10n_do_ncf_voided v
+                        WHERE v.company_id = %(company)s
+                          AND v.name = %(prefix)s || LPAD(n::text, %(width)s, '0')
+                    )
+                """, {
+                    'start': start,
+                    'end': end,
+                    'company': record.company_id.id,
+                    'prefix': record.prefix,
+                    'width': width,
+                })
+                burned = [row[0] for row in record.env.cr.fetchall()]
+                Voided._void_numbers(
+                    record, burned, 'native',
+                    note=_('Numero consumido por una transaccion revertida'),
+                )
+                if burned:
+                    _logger.info('NCF: %s numeros anulados por conciliacion en %s', len(burned), record.name)
+            record.write({
+                'native_reconciled_upto': max(end, record.native_reconciled_upto),
+                'native_pending_upto': last_value,
+            })
+        self._native_sync_current_number()
+
+    def action_native_reconcile(self):
+        """Sincronizar y conciliar manualmente la secuencia PostgreSQL"""
+        self.filtered(lambda r: r.allocation_mode == 'native')._native_reconcile()
+        return True
+
+    @api.model
+    def _cron_native_reconcile(self):
+        self.search([('allocation_mode', '=', 'native')])._native_reconcile()
+
+    # =====================================================
+    # CICLO DE VIDA
+    # =====================================================
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records.filtered(lambda r: r.allocation_mode == 'native')._native_ensure()
+        return records
+
+    def write(self, vals):
+        leaving_native = self.browse()
+        if 'allocation_mode' in vals and vals['allocation_mode'] != 'native':
+            leaving_native = self.filtered(lambda r: r.allocation_mode == 'native')
+            leaving_native._native_sync_current_number()
+        result = super().write(vals)
+        if {'allocation_mode', 'range_from', 'range_to'} & set(vals):
+            self.filtered(lambda r: r.allocation_mode == 'native')._native_ensure()
+            leaving_native._native_drop()
+        return result
+
+    def unlink(self):
+        native = self.filtered(lambda r: r.allocation_mode == 'native')
+        native_ids = native.ids
+        result = super().unlink()
+        for record_id in native_ids:
+            self.env.cr.execute(SQL(
+                "DROP SEQUENCE IF EXISTS %s",
+                SQL.identifier(f'l10n_do_ncf_sequence_native_{record_id}')
+            ))
+        return result
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from psycopg2 import Error as PsycopgError
+from collections import defaultdict
+from datetime import timedelta
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Acumulados en memoria del proceso: (base de datos, secuencia) -> {campo: valor}
+_pending_stats = defaultdict(dict)
+_pending_lock = threading.Lock()
+_last_flush = {}
+
+# Segundos minimos entre escrituras de los acumulados a la base de datos
+STAT_FLUSH_INTERVAL = 60
+# Dias que se conservan las estadisticas por hora
+STAT_RETENTION_DAYS = 90
+
+SUM_FIELDS = (
+    'allocation_count', 'numbers_issued', 'license_ms', 'lock_ms', 'update_ms',
+    'assign_ms', 'nowait_failures', 'wait_timeouts', 'conflicts', 'lock_wait_count', 'lock_wait_ms',
+)
+MAX_FIELDS = ('lock_max_ms',)
+
+
+def elapsed_ms(start):
+    """Milisegundos transcurridos desde ``start`` (time.perf_counter)"""
+    return (time.perf_counter() - start) * 1000
+
+
+class NcfSequenceStat(models.Model):
+    _name = 'l10n_do_ncf.sequence.stat'
+    _description = 'Estadistica de Asignacion NCF por Hora'
+    _order = 'period_start desc, sequence_id'
+    _rec_name = 'sequence_id'
+
+    sequence_id = fields.Many2one(
+        'l10n_do_ncf.sequence',
+        string='Secuencia NCF',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    company_id = fields.Many2one(
+        'res.company',
+        string='Compania',
+        related='sequence_id.company_id',
+        store=True
+    )
+    period_start = fields.Datetime(
+        string='Hora',
+        required=True,
+        readonly=True,
+        help='Inicio de la hora a la que corresponden los acumulados'
+    )
+    allocation_count = fields.Integer(string='Asignaciones', readonly=True, aggregator='sum')
+    numbers_issued = fields.Integer(string='NCF Emitidos', readonly=True, aggregator='sum')
+    license_ms = fields.Float(string='Licencia (ms)', readonly=True, aggregator='sum')
+    lock_ms = fields.Float(string='Bloqueo (ms)', readonly=True, aggregator='sum')
+    lock_max_ms = fields.Float(string='Bloqueo Maximo (ms)', readonly=True, aggregator='max')
+    update_ms = fields.Float(string='Actualizacion (ms)', readonly=True, aggregator='sum',
+                             help='Tiempo del UPDATE del contador o del nextval() en modo PostgreSQL')
+    assign_ms = fields.Float(string='Asignacion a Facturas (ms)', readonly=True, aggregator='sum')
+    nowait_failures = fields.Integer(string='Fallos NOWAIT', readonly=True, aggregator='sum',
+                                     help='Asignaciones rechazadas porque la secuencia estaba bloqueada')
+    wait_timeouts = fields.Integer(string='Esperas Agotadas', readonly=True, aggregator='sum',
+                                   help='Asignaciones en cola que agotaron sus reintentos')
+    conflicts = fields.Integer(string='Conflictos de Actualizacion', readonly=True, aggregator='sum')
+    lock_wait_count = fields.Integer(string='Asignaciones en Cola', readonly=True, aggregator='sum',
+                                     help='Asignaciones que obtuvieron turno en modo en cola')
+    lock_wait_ms = fields.Float(string='Espera en Cola (ms)', readonly=True, aggregator='sum')
+    lock_avg_ms = fields.Float(
+        string='Bloqueo Promedio (ms)',
+        compute='_compute_averages'
+    )
+    total_avg_ms = fields.Float(
+        string='Tiempo Promedio (ms)',
+        compute='_compute_averages',
+        help='Tiempo promedio por asignacion: licencia, bloqueo, actualizacion y escritura en facturas'
+    )
+    lock_wait_avg_ms = fields.Float(
+        string='Espera Promedio en Cola (ms)',
+        compute='_compute_averages'
+    )
+
+    _sequence_period_uniq = models.Constraint(
+        'UNIQUE(sequence_id, period_start)',
+        'Ya existen estadisticas para esta secuencia en esa hora.',
+    )
+
+    @api.depends('allocation_count', 'license_ms', 'lock_ms', 'update_ms', 'assign_ms',
+                 'lock_wait_count', 'lock_wait_ms')
+    def _compute_averages(self):
+        for stat in self:
+            count = stat.allocation_count
+            if count:
+                stat.lock_avg_ms = stat.lock_ms / count
+                stat.total_avg_ms = (stat.license_ms + stat.lock_ms + stat.update_ms + stat.assign_ms) / count
+            else:
+                stat.lock_avg_ms = 0.0
+                stat.total_avg_ms = 0.0
+            if stat.lock_wait_count:
+                stat.lock_wait_avg_ms = stat.lock_wait_ms / stat.lock_wait_count
+            else:
+                stat.lock_wait_avg_ms = 0.0
+
+    @api.model
+    def _record(self, sequence_id, **values):
+        """Acumular en memoria los tiempos y contadores de una secuencia"""
+        key = (self.env.registry.db_name, sequence_id)
+        with _pending_lock:
+            pending = _pending_stats[key]
+            for name, value in values.items():
+                if name in MAX_FIELDS:
+                    pending[name] = max(pending.get(name, 0), value)
+                else:
+                    pending[name] = pending.get(name, 0) + value
+
+    @api.model
+    def _flush_pending(self, force=False):
+        """
+        Escribir los acumulados del proceso en la tabla de estadisticas.
+
+        Sin ``force`` se programa para despues del commit, como maximo una
+        vez cada ``STAT_FLUSH_INTERVAL`` segundos: la transaccion actual
+        puede tener bloqueada la fila de la secuencia, que la llave foranea
+        de las estadisticas necesita compartir.
+        """
+        if force:
+            self._write_pending()
+            return
+        postcommit = self.env.cr.postcommit
+        if postcommit.data.get('l10n_do_ncf_stat_flush'):
+            return
+        with _pending_lock:
+            if time.monotonic() - _last_flush.get(self.env.registry.db_name, 0) < STAT_FLUSH_INTERVAL:
+                return
+        postcommit.data['l10n_do_ncf_stat_flush'] = True
+        postcommit.add(self._write_pending)
+
+    def _write_pending(self):
+        """
+        Guardar los acumulados con un cursor propio: se conservan aunque la
+        transaccion que los produjo se revierta (por ejemplo por un fallo
+        NOWAIT).
+        """
+        registry = self.env.registry
+        dbname = registry.db_name
+        uid = self.env.uid
+        with _pending_lock:
+            _last_flush[dbname] = time.monotonic()
+            keys = [key for key in _pending_stats if key[0] == dbname]
+            items = [(key[1], _pending_stats.pop(key)) for key in keys]
+        if not items:
+            return
+
+        period_start = fields.Datetime.now().replace(minute=0, second=0, microsecond=0)
+        rows = []
+        for sequence_id, values in items:
+            row = {name: values.get(name, 0) for name in SUM_FIELDS + MAX_FIELDS}
+            row.update(sequence_id=sequence_id, period_start=period_start, uid=uid)
+            rows.append(row)
+        try:
+            with registry.cursor() as cr:
+                cr.executemany("""
+                    INSERT INTO l10n_do_ncf_sequence_stat AS stat (
+                        sequence_id, company_id, period_start,
+                        allocation_count, numbers_issued, license_ms, lock_ms, lock_max_ms,
+                        update_ms, assign_ms, nowait_failures, wait_timeouts, conflicts,
+                        lock_wait_count, lock_wait_ms,
+                        create_uid, create_date, write_uid, write_date
+                    )
+                    SELECT seq.id, seq.company_id, %(period_start)s,
+                        %(allocation_count)s, %(numbers_issued)s, %(license_ms)s, %(lock_ms)s, %(lock_max_ms)s,
+                        %(update_ms)s, %(assign_ms)s, %(nowait_failures)s, %(wait_timeouts)s, %(conflicts)s,
+                        %(lock_wait_count)s, %(lock_wait_ms)s,
+                        %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+                    FROM l10n_do_ncf_sequence seq
+                    WHERE seq.id = %(sequence_id)s
+                    ON CONFLICT (sequence_id, period_start) DO UPDATE SET
+                        allocation_count = stat.allocation_count + EXCLUDED.allocation_count,
+                        numbers_issued = stat.numbers_issued + EXCLUDED.numbers_issued,
+                        license_ms = stat.license_ms + EXCLUDED.license_ms,
+                        lock_ms = stat.lock_ms + EXCLUDED.lock_ms,
+                        lock_max_ms = GREATEST(stat.lock_max_ms, EXCLUDED.lock_max_ms),
+                        update_ms = stat.update_ms + EXCLUDED.update_ms,
+                        assign_ms = stat.assign_ms + EXCLUDED.assign_ms,
+                        nowait_failures = stat.nowait_failures + EXCLUDED.nowait_failures,
+                        wait_timeouts = stat.wait_timeouts + EXCLUDED.wait_timeouts,
+                        conflicts = stat.conflicts + EXCLUDED.conflicts,
+                        lock_wait_count = stat.lock_wait_count + EXCLUDED.lock_wait_count,
+                        lock_wait_ms = stat.lock_wait_ms + EXCLUDED.lock_wait_ms,
+                        write_uid = EXCLUDED.write_uid,
+                        write_date = EXCLUDED.write_date
+                """, rows)
+        except PsycopgError as e:
+            # Las estadisticas son informativas: nunca deben interrumpir la facturacion
+            _logger.warning('NCF: no se pudieron guardar las estadisticas de asignacion: %s', e)
+
+    @api.model
+    def _cron_flush_stats(self):
+        """Guardar los acumulados del proceso y depurar estadisticas antiguas"""
+        self._flush_pending(force=True)
+        limit = fields.Datetime.now() - timedelta(days=STAT_RETENTION_DAYS)
+        self.search([('period_start', '<', limit)]).unlink()
+
+
+class NcfSequence(models.Model):
+    _inherit = 'l10n_do_ncf.sequence'
+
+    stat_ids = fields.One2many(
+        'l10n_do_ncf.sequence.stat',
+        'sequence_id',
+        string='Estadisticas de Asignacion'
+    )
+
+    def action_view_stats(self):
+        """Ver estadisticas de asignacion de esta secuencia"""
+        self.ensure_one()
+        self.env['l10n_do_ncf.sequence.stat']._flush_pending(force=True)
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Rendimiento de Asignacion'),
+            'res_model': 'l10n_do_ncf.sequence.stat',
+            'view_mode': 'list,graph',
+            'domain': [('sequence_id', '=', self.id)],
+        }
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
 
 
@@ -69,6 +69,60 @@ class NcfType(models.Model):
         string='Secuencias'
     )
 
+    # =====================================================
+    # REGISTRO EN MEMORIA
+    # =====================================================
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return records
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
+
+    @api.model
+    @tools.ormcache()
+    def _get_type_registry(self):
+        """
+        Tipos de NCF activos indexados por codigo y por prefijo.
+        Se carga una vez por registro y se invalida al modificar tipos.
+
+        :return: tupla ``(por_codigo, por_prefijo)`` de diccionarios con
+                 datos inmutables (id, codigo, prefijo, es_electronico)
+        """
+        by_code = {}
+        by_prefix = {}
+        for ncf_type in self.sudo().search([]):
+            data = tools.frozendict({
+                'id': ncf_type.id,
+                'code': ncf_type.code,
+                'prefix': ncf_type.prefix,
+                'is_electronic': ncf_type.is_electronic,
+            })
+            by_code.setdefault(ncf_type.code, data)
+            by_prefix.setdefault(ncf_type.prefix, data)
+        return tools.frozendict(by_code), tools.frozendict(by_prefix)
+
+    @api.model
+    def _get_by_code(self, code):
+        """Tipo de NCF activo por codigo (ej: '01'), o vacio"""
+        data = self._get_type_registry()[0].get(code)
+        return self.browse(data['id']) if data else self.browse()
+
+    @api.model
+    def _get_serial_width(self, prefix):
+        """Digitos de la serie para el prefijo: 10 en e-CF, 8 en NCF"""
+        data = self._get_type_registry()[1].get(prefix)
+        return 10 if data and data['is_electronic'] else 8
+
     @api.constrains('code')
     def _check_code_unique(self):
         for record in self:
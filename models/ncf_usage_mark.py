@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+
+
+class NcfUsageMark(models.Model):
+    _name = 'l10n_do_ncf.usage.mark'
+    _description = 'Ultimo NCF Emitido por Tipo'
+    _rec_name = 'ncf_type_id'
+
+    company_id = fields.Many2one(
+        'res.company',
+        string='Compania',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    ncf_type_id = fields.Many2one(
+        'l10n_do_ncf.type',
+        string='Tipo de NCF',
+        required=True,
+        readonly=True,
+        ondelete='cascade'
+    )
+    last_number = fields.Integer(
+        string='Ultimo Numero Emitido',
+        readonly=True,
+        help='Numero mas alto asignado para este tipo de NCF en la compania'
+    )
+
+    _company_type_uniq = models.Constraint(
+        'UNIQUE(company_id, ncf_type_id)',
+        'Ya existe una marca de uso para este tipo de NCF en la compania.',
+    )
+
+    @api.model
+    def _bump(self, company_id, ncf_type_id, number):
+        """Subir la marca de uso si ``number`` es mayor al registrado"""
+        self.env.cr.execute("""
+            INSERT INTO l10n_do_ncf_usage_mark
+                (company_id, ncf_type_id, last_number, create_uid, create_date, write_uid, write_date)
+            VALUES (%(company)s, %(type)s, %(number)s, %(uid)s, NOW(), %(uid)s, NOW())
+            ON CONFLICT (company_id, ncf_type_id) DO UPDATE
+            SET last_number = GREATEST(l10n_do_ncf_usage_mark.last_number, EXCLUDED.last_number),
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+        """, {'company': company_id, 'type': ncf_type_id, 'number': number, 'uid': self.env.uid})
+        self.invalidate_model(['last_number'])
+
+    @api.model
+    def _get_last_number(self, company_id, ncf_type_id):
+        """Ultimo numero emitido, o ``None`` si no hay marca registrada"""
+        self.env.cr.execute("""
+            SELECT last_number FROM l10n_do_ncf_usage_mark
+            WHERE company_id = %s AND ncf_type_id = %s
+        """, (company_id, ncf_type_id))
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
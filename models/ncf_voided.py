@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+
+
+class NcfVoided(models.Model):
+    _name = 'l10n_do_ncf.voided'
+    _description = 'NCF Anulado sin Factura'
+    _order = 'date desc, name'
+
+    name = fields.Char(
+        string='NCF',
+        required=True,
+        readonly=True
+    )
+    company_id = fields.Many2one(
+        'res.company',
+        string='Compania',
+        required=True,
+        default=lambda self: self.env.company
+    )
+    sequence_id = fields.Many2one(
+        'l10n_do_ncf.sequence',
+        string='Secuencia NCF',
+        ondelete='restrict',
+        readonly=True
+    )
+    ncf_type_id = fields.Many2one(
+        'l10n_do_ncf.type',
+        string='Tipo de NCF',
+        related='sequence_id.ncf_type_id',
+        store=True
+    )
+    number = fields.Integer(
+        string='Numero',
+        readonly=True
+    )
+    date = fields.Date(
+        string='Fecha de Anulacion',
+        required=True,
+        default=fields.Date.context_today
+    )
+    reason = fields.Selection([
+        ('01', '01 - Deterioro de Factura Pre-impresa'),
+        ('02', '02 - Errores de Impresion (Factura Pre-impresa)'),
+        ('03', '03 - Impresion Defectuosa'),
+        ('04', '04 - Correccion de la Informacion'),
+        ('05', '05 - Cambio de Productos'),
+        ('06', '06 - Devolucion de Productos'),
+        ('07', '07 - Omision de Productos'),
+        ('08', '08 - Errores en Secuencia de NCF'),
+        ('09', '09 - Por Cese de Operaciones'),
+        ('10', '10 - Perdida o Hurto de Talonarios'),
+    ], string='Tipo de Anulacion', required=True, default='08',
+        help='Codigo de anulacion reportado en el formato 608')
+    origin = fields.Selection([
+        ('lease', 'Arrendamiento no Utilizado'),
+        ('native', 'Consumido sin Factura (Secuencia PostgreSQL)'),
+        ('manual', 'Manual'),
+    ], string='Origen', required=True, default='manual', readonly=True)
+    lease_id = fields.Many2one(
+        'l10n_do_ncf.sequence.lease',
+        string='Arrendamiento',
+        readonly=True
+    )
+    note = fields.Text(string='Nota')
+
+    _ncf_company_uniq = models.Constraint(
+        'UNIQUE(company_id, name)',
+        'Este NCF ya fue registrado como anulado.',
+    )
+
+    @api.model
+    def _void_numbers(self, sequence, numbers, origin, reason='08', lease=None, note=False):
+        """Registrar como anulados los numeros indicados de una secuencia"""
+        if not numbers:
+            return self.browse()
+        return self.sudo().create([{
+            'name': sequence._format_ncf(number),
+            'company_id': sequence.company_id.id,
+            'sequence_id': sequence.id,
+            'number': number,
+            'reason': reason,
+            'origin': origin,
+            'lease_id': lease.id if lease else False,
+            'note': note,
+        } for number in numbers])
@@ -32,6 +32,25 @@ class ResCompany(models.Model):
         help='Diario para compras a proveedores informales'
     )
 
+    l10n_do_ncf_allocation_mode = fields.Selection([
+        ('nowait', 'Inmediato (falla si la secuencia esta ocupada)'),
+        ('wait', 'En cola (espera su turno con reintentos)'),
+    ], string='Modo de Asignacion NCF', default='nowait', required=True,
+        help='Comportamiento cuando dos usuarios generan NCF de la misma secuencia al mismo tiempo'
+    )
+
+    l10n_do_ncf_lock_timeout = fields.Integer(
+        string='Espera Maxima por Intento (ms)',
+        default=2000,
+        help='Milisegundos que se espera el bloqueo de la secuencia en cada intento (modo en cola)'
+    )
+
+    l10n_do_ncf_lock_retries = fields.Integer(
+        string='Reintentos de Bloqueo',
+        default=5,
+        help='Cantidad de reintentos antes de fallar cuando la secuencia sigue ocupada (modo en cola)'
+    )
+
 
 class ResConfigSettings(models.TransientModel):
     _inherit = 'res.config.settings'
@@ -55,3 +74,18 @@ class ResConfigSettings(models.TransientModel):
         related='company_id.l10n_do_informal_vendor_journal_id',
         readonly=False
     )
+    
+    l10n_do_ncf_allocation_mode = fields.Selection(
+        related='company_id.l10n_do_ncf_allocation_mode',
+        readonly=False
+    )
+    
+    l10n_do_ncf_lock_timeout = fields.Integer(
+        related='company_id.l10n_do_ncf_lock_timeout',
+        readonly=False
+    )
+    
+    l10n_do_ncf_lock_retries = fields.Integer(
+        related='company_id.l10n_do_ncf_lock_retries',
+        readonly=False
+    )
@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+# benchmark_ncf_posting no es una prueba automatica: se ejecuta a mano
+# contra una base de datos desechable (ver su docstring).
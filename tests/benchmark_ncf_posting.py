@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de confirmacion concurrente de facturas con NCF.
+
+Crea companias, clientes de cada tipo de contribuyente y facturas en
+borrador, y luego las confirma con N hilos concurrentes mediante
+``AccountMove.action_post``. Cada hilo usa su propio cursor y confirma
+(commit) despues de cada lote, como lo haria un worker de Odoo. Con varias
+companias, cada lote mezcla facturas de todas ellas.
+
+Reporta facturas por segundo, latencia p50/p95/p99 por llamada, fallos por
+bloqueo de la secuencia y consultas SQL por factura confirmada. Cualquier
+otro error al confirmar hace fallar la ejecucion: el resultado no mediria
+la asignacion de NCF.
+
+Los datos generados quedan en la base de datos: usar siempre una base
+desechable con el modulo instalado. Ejemplo::
+
+    python -m odoo.addons.l10n_do_ncf.tests.benchmark_ncf_posting \\
+        -c /etc/odoo/odoo.conf -d ncf_bench --workers 8 --invoices 2000
+"""
+import argparse
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from itertools import chain, zip_longest
+from datetime import date
+
+from psycopg2.errors import LockNotAvailable
+
+import odoo
+from odoo import SUPERUSER_ID, api
+from odoo.exceptions import UserError
+from odoo.modules.registry import Registry
+
+_logger = logging.getLogger(__name__)
+
+# Tipo de contribuyente del cliente -> datos adicionales
+PARTNER_PROFILES = {
+    'taxpayer': {'vat': '101000001'},
+    'non_taxpayer': {},
+    'final_consumer': {},
+    'special_regime': {'vat': '101000002'},
+    'governmental': {'vat': '401000003'},
+}
+# Tipos de NCF que necesitan secuencia activa para los perfiles anteriores
+NCF_TYPE_CODES = ('01', '02', '14', '15')
+SEQUENCE_RANGE_TO = 10000000
+CREATE_BATCH = 500
+
+# Mensajes de UserError que indican contencion en la secuencia
+LOCK_ERROR_MARKERS = ('ocupada', 'concurrencia')
+
+
+def percentile(values, pct):
+    """Percentil por rango mas cercano de una lista ya ordenada"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, math.ceil(pct / 100.0 * len(values)) - 1))
+    return values[index]
+
+
+def setup_data(env, options):
+    """
+    Crear companias, licencias, secuencias, clientes y facturas en borrador.
+
+    :return: {id de compania: [ids de facturas]}
+    """
+    country = env.ref('base.do')
+    currency = env.ref('base.DOP')
+    NcfType = env['l10n_do_ncf.type']
+    stamp = int(time.time())
+    invoice_ids = {}
+
+    for index in range(options.companies):
+        company = env['res.company'].create({
+            'name': f'NCF Benchmark {stamp}-{index}',
+            'country_id': country.id,
+            'currency_id': currency.id,
+        })
+        env.user.company_ids |= company
+        env['account.chart.template'].try_loading(options.chart, company, install_demo=False)
+
+        env['l10n_do_ncf.license.config'].create({
+            'license_key': f'BENCH-{stamp}-{index}',
+            'company_rnc': '101000000',
+            'company_id': company.id,
+            'is_valid': True,
+            'status': 'active',
+        })
+
+        company_env = env(context=dict(env.context, allowed_company_ids=[company.id]))
+        Sequence = company_env['l10n_do_ncf.sequence']
+        for code in NCF_TYPE_CODES:
+            ncf_type = NcfType._get_by_code(code)
+            if not ncf_type:
+                continue
+            sequence = Sequence.create({
+                'company_id': company.id,
+                'ncf_type_id': ncf_type.id,
+                'range_from': 1,
+                'range_to': SEQUENCE_RANGE_TO,
+                'allocation_mode': options.mode,
+            })
+            sequence.action_activate()
+
+        partners = company_env['res.partner'].with_context(no_vat_validation=True).create([{
+            'name': f'Cliente {taxpayer_type} {index}',
+            'country_id': country.id,
+            'company_id': company.id,
+            'l10n_do_dgii_tax_payer_type': taxpayer_type,
+            **profile,
+        } for taxpayer_type, profile in PARTNER_PROFILES.items()])
+
+        Move = company_env['account.move']
+        per_company = options.invoices // options.companies
+        for start in range(0, per_company, CREATE_BATCH):
+            moves = Move.create([{
+                'move_type': 'out_invoice',
+                'partner_id': partners[number % len(partners)].id,
+                'invoice_date': date.today(),
+                'invoice_line_ids': [(0, 0, {
+                    'name': 'Servicio benchmark',
+                    'quantity': 1,
+                    'price_unit': 100.0,
+                })],
+            } for number in range(start, min(start + CREATE_BATCH, per_company))])
+            invoice_ids.setdefault(company.id, []).extend(moves.ids)
+        env.cr.commit()
+        _logger.info('Benchmark: compania %s lista (%s facturas)', company.name, per_company)
+
+    return invoice_ids
+
+
+def worker(registry, move_ids, batch_size, stats, lock):
+    """Confirmar ``move_ids`` en lotes con un cursor propio"""
+    threading.current_thread().dbname = registry.db_name
+    local = defaultdict(int)
+    latencies = []
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        Move = env['account.move']
+        for start in range(0, len(move_ids), batch_size):
+            batch = move_ids[start:start + batch_size]
+            queries_before = cr.sql_log_count
+            began = time.perf_counter()
+            try:
+                moves = Move.browse(batch)
+                moves.action_post()
+                cr.commit()
+                local['posted'] += len(batch)
+                local['queries'] += cr.sql_log_count - queries_before
+                latencies.append(time.perf_counter() - began)
+            except LockNotAvailable:
+                cr.rollback()
+                local['lock_failures'] += 1
+            except UserError as e:
+                cr.rollback()
+                if any(marker in str(e) for marker in LOCK_ERROR_MARKERS):
+                    local['lock_failures'] += 1
+                else:
+                    local['errors'] += 1
+                    _logger.warning('Benchmark: error al confirmar %s: %s', batch, e)
+            env.invalidate_all()
+    with lock:
+        for key, value in local.items():
+            stats[key] += value
+        stats['latencies'].extend(latencies)
+
+
+def run(registry, invoice_ids, options):
+    """Repartir las facturas entre los hilos y medir"""
+    # Facturas intercaladas por compania: cada lote mezcla companias, y la
+    # licencia debe validarse con la compania de cada secuencia
+    mixed = [move_id for move_id in chain.from_iterable(zip_longest(*invoice_ids.values())) if move_id]
+    # Reparto alternado: todos los hilos compiten por las mismas secuencias
+    chunks = [mixed[index::options.workers] for index in range(options.workers)]
+    stats = defaultdict(int)
+    stats['latencies'] = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(registry, chunk, options.batch, stats, lock))
+        for chunk in chunks if chunk
+    ]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats['elapsed'] = time.perf_counter() - began
+    return stats
+
+
+def report(stats, options):
+    latencies = sorted(stats['latencies'])
+    posted = stats['posted']
+    elapsed = stats['elapsed'] or 1e-9
+    lines = [
+        'Benchmark NCF: %s hilos, lotes de %s, modo %s' % (options.workers, options.batch, options.mode),
+        '  Facturas confirmadas: %s en %.2f s' % (posted, elapsed),
+        '  Facturas por segundo: %.1f' % (posted / elapsed),
+        '  Latencia por lote p50/p95/p99 (ms): %.1f / %.1f / %.1f' % (
+            percentile(latencies, 50) * 1000,
+            percentile(latencies, 95) * 1000,
+            percentile(latencies, 99) * 1000,
+        ),
+        '  Fallos por bloqueo: %s' % stats['lock_failures'],
+        '  Otros errores: %s' % stats['errors'],
+        '  Consultas por factura: %.1f' % (stats['queries'] / posted if posted else 0.0),
+    ]
+    print('\n'.join(lines))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de confirmacion concurrente de facturas NCF')
+    parser.add_argument('-c', '--config', help='Archivo de configuracion de Odoo')
+    parser.add_argument('-d', '--database', required=True, help='Base de datos desechable con l10n_do_ncf')
+    parser.add_argument('--workers', type=int, default=4, help='Hilos concurrentes')
+    parser.add_argument('--invoices', type=int, default=1000, help='Total de facturas a generar')
+    parser.add_argument('--companies', type=int, default=1, help='Companias sinteticas')
+    parser.add_argument('--batch', type=int, default=1, help='Facturas por llamada a action_post')
+    parser.add_argument('--mode', default='nowait', choices=['nowait', 'wait', 'native'],
+                        help='Modo de asignacion de las secuencias generadas')
+    parser.add_argument('--chart', default='do', help='Plan contable para las companias sinteticas')
+    options = parser.parse_args(argv)
+
+    odoo_args = ['-d', options.database]
+    if options.config:
+        odoo_args += ['-c', options.config]
+    odoo.tools.config.parse_config(odoo_args)
+
+    registry = Registry(options.database)
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        invoice_ids = setup_data(env, options)
+
+    stats = run(registry, invoice_ids, options)
+    report(stats, options)
+    if stats['errors']:
+        raise SystemExit('Benchmark invalido: %s lotes fallaron por errores ajenos al bloqueo' % stats['errors'])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
 from . import dgii_report_wizard
+from . import dgii_batch_wizard
 from . import account_move_reversal
 from . import setup_wizard
@@ -13,7 +13,7 @@ class AccountMoveReversal(models.TransientModel):
         # Si la factura original tiene NCF
         if move.l10n_do_ncf_number:
             # Buscar tipo Nota de Credito (04)
-            ncf_type = self.env['l10n_do_ncf.type'].search([('code', '=', '04')], limit=1)
+            ncf_type = self.env['l10n_do_ncf.type']._get_by_code('04')
             
             values.update({
                 'l10n_do_ncf_type_id': ncf_type.id if ncf_type else False,
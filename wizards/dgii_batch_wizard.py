@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Generacion en lote de reportes DGII para varias companias y periodos.
+
+Cada reporte se encola como un trabajo en segundo plano
+(``l10n_do_ncf.dgii.report.job``) de un lote: la peticion web solo crea los
+trabajos, varios crons los generan a la vez por bloques, sin el limite de
+tiempo de la peticion, y el lote reune los archivos en un solo ZIP.
+"""
+
+from odoo import models, fields, Command, _
+from odoo.exceptions import AccessError, UserError
+from dateutil.relativedelta import relativedelta
+
+BATCH_REPORT_FIELDS = {
+    '606': 'include_606',
+    '607': 'include_607',
+    '608': 'include_608',
+    '609': 'include_609',
+    'ir17': 'include_ir17',
+}
+
+
+class DgiiBatchReportWizard(models.TransientModel):
+    _name = 'l10n_do_ncf.dgii.batch.wizard'
+    _description = 'Generar Reportes DGII en Lote'
+
+    company_ids = fields.Many2many(
+        'res.company',
+        string='Companias',
+        required=True,
+        default=lambda self: self.env.company
+    )
+    date_from = fields.Date(
+        string='Desde',
+        required=True,
+        default=lambda self: fields.Date.context_today(self).replace(day=1) - relativedelta(months=1)
+    )
+    date_to = fields.Date(
+        string='Hasta',
+        required=True,
+        default=lambda self: fields.Date.context_today(self).replace(day=1) - relativedelta(days=1)
+    )
+    include_606 = fields.Boolean(string='606 - Compras', default=True)
+    include_607 = fields.Boolean(string='607 - Ventas', default=True)
+    include_608 = fields.Boolean(string='608 - Anulados', default=True)
+    include_609 = fields.Boolean(string='609 - Pagos al Exterior', default=True)
+    include_ir17 = fields.Boolean(string='IR-17 - Retenciones')
+
+    def _get_periods(self):
+        """Meses completos o parciales entre las fechas: [(desde, hasta)]"""
+        self.ensure_one()
+        periods = []
+        start = self.date_from
+        while start <= self.date_to:
+            end = min(start + relativedelta(day=31), self.date_to)
+            periods.append((start, end))
+            start = end + relativedelta(days=1)
+        return periods
+
+    def _get_tasks(self):
+        self.ensure_one()
+        report_types = [rtype for rtype, field in BATCH_REPORT_FIELDS.items() if self[field]]
+        return [
+            {
+                'company_id': company.id,
+                'report_type': report_type,
+                'date_from': period_from,
+                'date_to': period_to,
+            }
+            for company in self.company_ids
+            for period_from, period_to in self._get_periods()
+            for report_type in report_types
+        ]
+
+    def action_generate(self):
+        """Crear el lote con un trabajo por compania, mes y tipo de reporte"""
+        self.ensure_one()
+        if self.date_from > self.date_to:
+            raise UserError(_('La fecha inicial no puede ser posterior a la final.'))
+        tasks = self._get_tasks()
+        if not tasks:
+            raise UserError(_('Seleccione al menos un tipo de reporte.'))
+        self.env['account.move'].check_access('read')
+        # Los reportes se leen por SQL, sin reglas de registro por compania
+        forbidden = self.company_ids - self.env.companies
+        if forbidden:
+            raise AccessError(_('No tiene acceso a los documentos de: %s') % ', '.join(forbidden.mapped('name')))
+
+        batch = self.env['l10n_do_ncf.dgii.report.batch'].create({
+            'company_ids': [Command.set(self.company_ids.ids)],
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+            'job_ids': [Command.create(task) for task in tasks],
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': batch._name,
+            'res_id': batch.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
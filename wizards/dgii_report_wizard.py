@@ -13,9 +13,48 @@ Validado contra:
 """
 
 from odoo import models, fields, api, _
-from odoo.exceptions import UserError
-import base64
+from odoo.exceptions import AccessError, UserError
+from odoo.tools import SQL
 from datetime import date, timedelta
+from ..models.dgii_report_writer import REPORT_BATCH, DgiiReportWriter, store_file, temp_directory
+from ..models.fiscal_ledger import LEDGER_COLUMNS, LEDGER_FROM, LEDGER_REPORTS
+from contextlib import ExitStack
+import itertools
+import os
+import tempfile
+import zipfile
+
+# Forma de pago del 606 segun el tipo de diario del pago
+PAYMENT_FORM_BY_JOURNAL = {
+    'cash': '01',
+    'bank': '02',
+}
+# Nombres unicos para los cursores del servidor de la transaccion
+_cursor_ids = itertools.count(1)
+
+# Columnas de las facturas, su contacto, su origen y su tipo de NCF
+REPORT_COLUMNS = """
+    SELECT m.id, m.company_id, m.name, m.ref, m.move_type, m.invoice_date, m.payment_state,
+           m.amount_untaxed, m.amount_tax, m.amount_total, m.amount_residual,
+           m.reversed_entry_id, m.l10n_do_expense_type, m.l10n_do_vendor_ncf,
+           m.l10n_do_ncf_number, m.l10n_do_ncf_origin,
+           COALESCE(m.l10n_do_total_isr_retention, 0) AS isr_retention,
+           COALESCE(m.l10n_do_total_itbis_retention, 0) AS itbis_retention,
+           p.vat AS partner_vat, p.name AS partner_name,
+           p.is_company AS partner_is_company, pc.code AS partner_country_code,
+           origin.l10n_do_vendor_ncf AS origin_vendor_ncf,
+           t.code AS ncf_type_code
+"""
+REPORT_FROM = """
+    FROM account_move m
+    LEFT JOIN res_partner p ON p.id = m.partner_id
+    LEFT JOIN res_country pc ON pc.id = p.country_id
+    LEFT JOIN account_move origin ON origin.id = m.reversed_entry_id
+    LEFT JOIN l10n_do_ncf_type t ON t.id = m.l10n_do_ncf_type_id
+"""
+
+# Formatos incluidos en el paquete del periodo
+BUNDLE_REPORTS = ('606', '607', '608', '609', 'ir17')
 
 
 class DgiiReportWizard(models.TransientModel):
@@ -34,6 +73,7 @@ class DgiiReportWizard(models.TransientModel):
         ('608', '608 - Comprobantes Anulados'),
         ('609', '609 - Pagos al Exterior'),
         ('ir17', 'IR-17 - Resumen de Retenciones'),
+        ('bundle', 'Paquete del Periodo (ZIP con todos los formatos)'),
     ], string='Tipo de Reporte', required=True, default='607')
 
     date_from = fields.Date(
@@ -47,12 +87,16 @@ class DgiiReportWizard(models.TransientModel):
         default=lambda self: date.today()
     )
 
-    file_data = fields.Binary(string='Archivo', readonly=True)
+    attachment_id = fields.Many2one('ir.attachment', string='Archivo', readonly=True)
     file_name = fields.Char(string='Nombre del Archivo', readonly=True)
     state = fields.Selection([
         ('draft', 'Borrador'),
+        ('queued', 'En Segundo Plano'),
         ('generated', 'Generado'),
     ], default='draft')
+    job_id = fields.Many2one('l10n_do_ncf.dgii.report.job', string='Trabajo', readonly=True)
+    job_state = fields.Selection(related='job_id.state', string='Estado del Trabajo')
+    job_progress = fields.Float(related='job_id.progress', string='Progreso')
 
     record_count = fields.Integer(string='Registros', readonly=True)
     total_amount = fields.Monetary(string='Monto Total', readonly=True, currency_field='currency_id')
@@ -61,6 +105,7 @@ class DgiiReportWizard(models.TransientModel):
     ir17_total_itbis = fields.Monetary(string='Total Retencion ITBIS', readonly=True, currency_field='currency_id')
     ir17_total = fields.Monetary(string='Total a Pagar DGII', readonly=True, currency_field='currency_id')
     currency_id = fields.Many2one('res.currency', default=lambda self: self.env.company.currency_id)
+    bundle_summary = fields.Text(string='Resumen del Paquete', readonly=True)
 
     @api.onchange('date_from')
     def _onchange_date_from(self):
@@ -114,373 +159,603 @@ class DgiiReportWizard(models.TransientModel):
             return tipo
         return '02'
 
+    @api.model
+    def _report_condition(self, report_type):
+        """Condicion SQL, sin periodo, de las facturas de cada reporte"""
+        has_ncf = SQL("COALESCE(m.l10n_do_ncf_number, '') != ''")
+        purchases = SQL("m.move_type IN ('in_invoice', 'in_refund') AND m.state = 'posted'")
+        if report_type == '606':
+            return purchases
+        if report_type == '607':
+            return SQL("m.move_type IN ('out_invoice', 'out_refund') AND m.state = 'posted' AND %s", has_ncf)
+        if report_type == '608':
+            return SQL("m.state = 'cancel' AND %s", has_ncf)
+        if report_type == '609':
+            return SQL("m.move_type = 'in_invoice' AND m.state = 'posted' AND pc.code != 'DO'")
+        if report_type == 'ir17':
+            return SQL(
+                "%s AND (m.l10n_do_total_isr_retention > 0 OR m.l10n_do_total_itbis_retention > 0)",
+                purchases,
+            )
+        raise UserError(_('Tipo de reporte no soportado: %s') % report_type)
+
+    def _period_where(self):
+        return SQL(
+            "m.company_id = %s AND m.invoice_date BETWEEN %s AND %s",
+            self.company_id.id, self.date_from, self.date_to,
+        )
+
+    def _report_where(self, report_type):
+        """Condicion SQL de las facturas que entran en cada reporte"""
+        return SQL("%s AND %s", self._period_where(), self._report_condition(report_type))
+
+    def _rows_where(self):
+        """Condicion SQL de las filas del reporte en su origen (ver ``_report_source``)"""
+        if self.report_type in LEDGER_REPORTS:
+            return SQL("%s AND m.report_type = %s", self._period_where(), self.report_type)
+        return self._report_where(self.report_type)
+
+    def _report_source(self):
+        """Columnas y origen de las filas: el libro fiscal para 606/607, las facturas para el resto"""
+        if self.report_type in LEDGER_REPORTS:
+            return SQL(LEDGER_COLUMNS), SQL(LEDGER_FROM)
+        return SQL(REPORT_COLUMNS), SQL(REPORT_FROM)
+
+    def _prepare_report(self):
+        """Poner al dia el libro fiscal del periodo antes de leerlo"""
+        self.env.flush_all()
+        if self.report_type in LEDGER_REPORTS:
+            self.env['l10n_do_ncf.fiscal.ledger'].sudo()._refresh_period(
+                self.company_id, self.report_type, self.date_from, self.date_to
+            )
+
+    def _count_report_rows(self, where):
+        self.env.cr.execute(SQL("SELECT COUNT(*) %s WHERE %s", self._report_source()[1], where))
+        return self.env.cr.fetchone()[0]
+
+    def _fetch_report_rows(self, where, extra_columns=None):
+        """
+        Recorrer las filas del reporte con un cursor del servidor: se leen
+        ``REPORT_BATCH`` filas a la vez y solo el lote actual vive en memoria.
+        """
+        cr = self.env.cr
+        cursor_name = SQL.identifier(f'l10n_do_ncf_report_{next(_cursor_ids)}')
+        columns, source = self._report_source()
+        if extra_columns:
+            columns = SQL("%s, %s", columns, extra_columns)
+        cr.execute(SQL(
+            "DECLARE %s NO SCROLL CURSOR FOR %s %s WHERE %s ORDER BY m.invoice_date, m.id",
+            cursor_name, columns, source, where,
+        ))
+        while True:
+            cr.execute(SQL("FETCH FORWARD %s FROM %s", REPORT_BATCH, cursor_name))
+            rows = cr.dictfetchall()
+            if not rows:
+                break
+            yield from rows
+        cr.execute(SQL("CLOSE %s", cursor_name))
+
+    def _read_report_rows(self, where, after=None, limit=REPORT_BATCH):
+        """
+        Leer las siguientes ``limit`` filas del reporte despues de la llave
+        ``after`` = (invoice_date, id), en el mismo orden del reporte.
+        """
+        if after:
+            where = SQL("%s AND (m.invoice_date, m.id) > (%s, %s)", where, after[0], after[1])
+        columns, source = self._report_source()
+        self.env.cr.execute(SQL(
+            "%s %s WHERE %s ORDER BY m.invoice_date, m.id LIMIT %s",
+            columns, source, where, limit,
+        ))
+        return self.env.cr.dictfetchall()
+
+    @api.model
+    def _read_move_rows(self, where):
+        """Leer de las facturas las filas que cumplen ``where``"""
+        self.env.cr.execute(SQL(
+            "%s %s WHERE %s ORDER BY m.id",
+            SQL(REPORT_COLUMNS), SQL(REPORT_FROM), where,
+        ))
+        return self.env.cr.dictfetchall()
+
+    def _store_report(self, writer, file_name):
+        """Guardar el archivo escrito como adjunto del asistente"""
+        self._own_attachment().unlink()
+        self.attachment_id = writer.save(file_name, self._name, self.id)
+        self.file_name = file_name
+
+    def _check_report_access(self):
+        """
+        Las filas se leen por SQL, sin reglas de registro: exigir lectura de
+        facturas y que la compania este entre las permitidas al usuario.
+        """
+        self.env['account.move'].check_access('read')
+        if self.company_id not in self.env.companies:
+            raise AccessError(_('No tiene acceso a los documentos de la compania %s.') % self.company_id.name)
+
     def action_generate_report(self):
         self.ensure_one()
-        if self.report_type == '606':
-            return self._generate_606()
-        elif self.report_type == '607':
-            return self._generate_607()
-        elif self.report_type == '608':
-            return self._generate_608()
-        elif self.report_type == '609':
-            return self._generate_609()
-        elif self.report_type == 'ir17':
-            return self._generate_ir17()
-
-    def _generate_606(self):
-        invoices = self.env['account.move'].search([
-            ('company_id', '=', self.company_id.id),
-            ('move_type', 'in', ('in_invoice', 'in_refund')),
-            ('state', '=', 'posted'),
-            ('invoice_date', '>=', self.date_from),
-            ('invoice_date', '<=', self.date_to),
-        ], order='invoice_date')
-
-        lines = []
-        total_monto = 0.0
-        total_itbis = 0.0
+        self._check_report_access()
+        if self.report_type == 'bundle':
+            self._prepare_report()
+            return self._generate_bundle()
+
+        Cache = self.env['l10n_do_ncf.dgii.report.cache'].sudo()
+        entry = Cache._get_entry(self)
+        if entry.attachment_id and entry.version == Cache._get_version(self):
+            # Sin cambios desde la ultima generacion: devolver el archivo guardado
+            self._own_attachment().unlink()
+            values = self._report_values(entry.record_count, entry.total_amount, entry.total_itbis)
+            values.update({'attachment_id': entry.attachment_id.id, 'file_name': entry.file_name})
+            self.write(values)
+            return self._return_wizard()
+
+        # Poner al dia el libro fiscal cambia la version: tomarla despues
+        self._prepare_report()
+        version = Cache._get_version(self)
+        with DgiiReportWriter(self.env) as writer:
+            action = self._generate_report(writer)
+        Cache._store(self, version)
+        return action
+
+    def _own_attachment(self):
+        """Archivo generado por este asistente; los guardados en cache no se eliminan"""
+        return self.attachment_id.sudo().filtered(lambda a: a.res_model == self._name)
+
+    def action_generate_background(self):
+        """Encolar el reporte para generarlo por bloques fuera de la peticion web"""
+        self.ensure_one()
+        if self.report_type == 'bundle':
+            raise UserError(_('El paquete del periodo no se puede generar en segundo plano.'))
+        self._check_report_access()
+        job = self.env['l10n_do_ncf.dgii.report.job'].create({
+            'company_id': self.company_id.id,
+            'report_type': self.report_type,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+        })
+        self.write({'job_id': job.id, 'state': 'queued'})
+        return self._return_wizard()
 
-        rnc = self._clean_rnc(self.company_id.vat)
-        period = self.date_from.strftime('%Y%m')
-        lines.append(f"606|{rnc}|{period}|{len(invoices)}")
-
-        for inv in invoices:
-            rnc_supplier = self._clean_rnc(inv.partner_id.vat)
-            tipo_id = self._get_rnc_type(inv.partner_id.vat)
-            
-            if not rnc_supplier:
-                rnc_supplier = '00000000001'
-                tipo_id = '2'  # DGII exige tipo_id=2 para suplidor informal
-            
-            tipo_bienes_raw = getattr(inv, 'l10n_do_expense_type', None) or '02'
-            tipo_bienes = self._validate_tipo_bienes(tipo_bienes_raw)
-            
-            ncf = self._pad_ncf(getattr(inv, 'l10n_do_vendor_ncf', '') or '')
-            
-            ncf_modificado = ''
-            if inv.move_type == 'in_refund' and inv.reversed_entry_id:
-                ncf_mod = getattr(inv.reversed_entry_id, 'l10n_do_vendor_ncf', '') or ''
-                ncf_modificado = self._pad_ncf_modified(ncf_mod)
-            
-            fecha_comprobante = self._format_date(inv.invoice_date)
-            
-            fecha_pago = ''
-            if inv.payment_state in ('paid', 'in_payment'):
-                try:
-                    payments = inv._get_reconciled_payments()
-                    if payments:
-                        pay_date = max(p.date for p in payments)
-                        if pay_date >= inv.invoice_date:
-                            fecha_pago = self._format_date(pay_date)
-                        else:
-                            fecha_pago = fecha_comprobante
-                except Exception:
-                    fecha_pago = fecha_comprobante
-            
-            monto_bienes = 0.0
-            monto_servicios = abs(inv.amount_untaxed)
-            monto_total = monto_bienes + monto_servicios
-            itbis_facturado = abs(inv.amount_tax)
-            
-            itbis_retenido = abs(getattr(inv, 'l10n_do_total_itbis_retention', 0) or 0)
-            itbis_proporcionalidad = 0.0
-            itbis_costo = 0.0
-            itbis_adelantar = itbis_facturado - itbis_costo if itbis_facturado > itbis_costo else 0
-            itbis_percibido = 0.0
-            
-            tipo_retencion_isr = ''
-            monto_isr = abs(getattr(inv, 'l10n_do_total_isr_retention', 0) or 0)
-            if monto_isr > 0:
-                tipo_retencion_isr = '02'
-            
-            isr_percibido = 0.0
-            isc = 0.0
-            otros_impuestos = 0.0
-            propina_legal = 0.0
-            
-            if inv.payment_state == 'paid':
-                forma_pago = '02'
-            elif inv.payment_state == 'not_paid':
-                forma_pago = '04'
-            else:
-                forma_pago = '07'
-
-            total_monto += monto_total
-            total_itbis += itbis_facturado
-
-            campos = [
-                rnc_supplier, tipo_id, tipo_bienes, ncf, ncf_modificado,
-                fecha_comprobante, fecha_pago,
-                self._format_amount(monto_bienes), self._format_amount(monto_servicios),
-                self._format_amount_required(monto_total), self._format_amount(itbis_facturado),
-                self._format_amount(itbis_retenido), self._format_amount(itbis_proporcionalidad),
-                self._format_amount(itbis_costo), self._format_amount(itbis_adelantar),
-                self._format_amount(itbis_percibido), tipo_retencion_isr,
-                self._format_amount(monto_isr), self._format_amount(isr_percibido),
-                self._format_amount(isc), self._format_amount(otros_impuestos),
-                self._format_amount(propina_legal), forma_pago,
-            ]
-            lines.append('|'.join(campos))
-
-        content = '\n'.join(lines)
-        self.file_data = base64.b64encode(content.encode('utf-8'))
-        self.file_name = f"DGII_F_606_{rnc}_{period}.txt"
-        self.state = 'generated'
-        self.record_count = len(invoices)
-        self.total_amount = total_monto
-        self.total_itbis = total_itbis
+    def action_refresh_job(self):
+        """Consultar el avance del trabajo y mostrar el resumen al terminar"""
+        self.ensure_one()
+        job = self.job_id
+        if job.state == 'failed':
+            raise UserError(_('No se pudo generar el reporte:\n\n%s') % job.error_message)
+        if job.state == 'done':
+            values = self._report_values(job.record_count, job.total_amount, job.total_itbis)
+            values['file_name'] = job.file_name
+            self.write(values)
         return self._return_wizard()
 
-    def _generate_607(self):
-        invoices = self.env['account.move'].search([
-            ('company_id', '=', self.company_id.id),
-            ('move_type', 'in', ('out_invoice', 'out_refund')),
-            ('state', '=', 'posted'),
-            ('invoice_date', '>=', self.date_from),
-            ('invoice_date', '<=', self.date_to),
-            ('l10n_do_ncf_number', '!=', False),
-        ], order='invoice_date')
-
-        lines = []
-        total_monto = 0.0
-        total_itbis = 0.0
+    def _generate_report(self, writer):
+        where = self._rows_where()
+        count = self._report_count(where)
+        writer.write(self._report_header(count))
 
-        rnc = self._clean_rnc(self.company_id.vat)
-        period = self.date_from.strftime('%Y%m')
-        lines.append(f"607|{rnc}|{period}|{len(invoices)}")
+        total_amount = 0.0
+        total_itbis = 0.0
+        for row in self._fetch_report_rows(where):
+            line, amount, itbis = self._format_report_row(row)
+            total_amount += amount
+            total_itbis += itbis
+            writer.write(line)
+        writer.write_lines(self._report_footer_lines(count, total_amount, total_itbis))
 
-        for inv in invoices:
-            rnc_client = self._clean_rnc(inv.partner_id.vat)
-            
-            if rnc_client:
-                tipo_id = self._get_rnc_type(inv.partner_id.vat)
-            else:
-                tipo_id = '3'
-                rnc_client = '00000000000'
-            
-            ncf = self._pad_ncf(inv.l10n_do_ncf_number or '')
-            
-            ncf_modificado = ''
-            if inv.move_type == 'out_refund':
-                ncf_origin = getattr(inv, 'l10n_do_ncf_origin', '') or ''
-                ncf_modificado = self._pad_ncf_modified(ncf_origin)
-            
-            tipo_ingreso = '02'
-            ncf_type = getattr(inv, 'l10n_do_ncf_type_id', None)
-            if ncf_type:
-                code = ncf_type.code or ''
-                if code in ('B01', 'B02', 'B14', 'B15'):
-                    tipo_ingreso = '01'
-            
-            fecha_comprobante = self._format_date(inv.invoice_date)
-            fecha_retencion = ''
-            
-            monto_facturado = abs(inv.amount_untaxed)
-            itbis_facturado = abs(inv.amount_tax)
-            
-            itbis_retenido_terceros = 0.0
-            itbis_percibido = 0.0
-            retencion_renta_terceros = 0.0
-            isr_percibido = 0.0
-            isc = 0.0
-            otros_impuestos = 0.0
-            propina_legal = 0.0
-            
-            monto_total_con_itbis = abs(inv.amount_total)
-            
-            efectivo = 0.0
-            cheque = 0.0
-            tarjeta = 0.0
-            credito = 0.0
-            bonos = 0.0
-            permuta = 0.0
-            otras = 0.0
-            
-            if inv.payment_state == 'paid':
-                cheque = monto_total_con_itbis
-            elif inv.payment_state == 'not_paid':
-                credito = monto_total_con_itbis
-            elif inv.payment_state == 'partial':
-                pagado = abs(inv.amount_total) - abs(inv.amount_residual)
-                cheque = pagado
-                credito = abs(inv.amount_residual)
-            else:
-                credito = monto_total_con_itbis
-
-            total_monto += monto_facturado
-            total_itbis += itbis_facturado
-
-            campos = [
-                rnc_client, tipo_id, ncf, ncf_modificado, tipo_ingreso,
-                fecha_comprobante, fecha_retencion,
-                self._format_amount_required(monto_facturado), self._format_amount(itbis_facturado),
-                self._format_amount(itbis_retenido_terceros), self._format_amount(itbis_percibido),
-                self._format_amount(retencion_renta_terceros), self._format_amount(isr_percibido),
-                self._format_amount(isc), self._format_amount(otros_impuestos),
-                self._format_amount(propina_legal),
-                self._format_amount(efectivo), self._format_amount(cheque),
-                self._format_amount(tarjeta), self._format_amount(credito),
-                self._format_amount(bonos), self._format_amount(permuta),
-                self._format_amount(otras),
-            ]
-            lines.append('|'.join(campos))
-
-        content = '\n'.join(lines)
-        self.file_data = base64.b64encode(content.encode('utf-8'))
-        self.file_name = f"DGII_F_607_{rnc}_{period}.txt"
-        self.state = 'generated'
-        self.record_count = len(invoices)
-        self.total_amount = total_monto
-        self.total_itbis = total_itbis
+        self._store_report(writer, self._report_file_name())
+        self.write(self._report_values(count, total_amount, total_itbis))
         return self._return_wizard()
 
-    def _generate_608(self):
-        invoices = self.env['account.move'].search([
-            ('company_id', '=', self.company_id.id),
-            ('state', '=', 'cancel'),
-            ('invoice_date', '>=', self.date_from),
-            ('invoice_date', '<=', self.date_to),
-            ('l10n_do_ncf_number', '!=', False),
-        ], order='invoice_date')
-
-        lines = []
-        rnc = self._clean_rnc(self.company_id.vat)
-        period = self.date_from.strftime('%Y%m')
-        lines.append(f"608|{rnc}|{period}|{len(invoices)}")
-
-        for inv in invoices:
-            ncf = self._pad_ncf(inv.l10n_do_ncf_number or '')
-            fecha = self._format_date(inv.invoice_date)
-            tipo_anulacion = '04'
-            campos = [ncf, fecha, tipo_anulacion]
-            lines.append('|'.join(campos))
-
-        content = '\n'.join(lines)
-        self.file_data = base64.b64encode(content.encode('utf-8'))
-        self.file_name = f"DGII_F_608_{rnc}_{period}.txt"
-        self.state = 'generated'
-        self.record_count = len(invoices)
-        return self._return_wizard()
+    def _generate_bundle(self):
+        """
+        Paquete del periodo: las facturas del periodo se leen una sola vez y
+        cada fila se envia a los formatos que le aplican. Los archivos y un
+        resumen se entregan en un solo ZIP.
+        """
+        conditions = {report_type: self._report_condition(report_type) for report_type in BUNDLE_REPORTS}
+        period = self._period_where()
+        where = SQL("%s AND (%s)", period, SQL(" OR ").join(conditions.values()))
+
+        # Cantidades de cada formato para los encabezados, con una sola consulta
+        self.env.cr.execute(SQL(
+            "SELECT %s %s WHERE %s",
+            SQL(", ").join(SQL("COUNT(*) FILTER (WHERE %s)", cond) for cond in conditions.values()),
+            SQL(REPORT_FROM), where,
+        ))
+        counts = dict(zip(conditions, self.env.cr.fetchone()))
+        counts['608'] += self._voided_count()
+
+        summary = []
+        parts = {}
+        with ExitStack() as stack:
+            for report_type in BUNDLE_REPORTS:
+                if report_type == 'ir17' and not counts['ir17']:
+                    summary.append(_('IR-17: no hay facturas con retenciones en el periodo'))
+                    continue
+                part = self.new({
+                    'company_id': self.company_id.id,
+                    'report_type': report_type,
+                    'date_from': self.date_from,
+                    'date_to': self.date_to,
+                })
+                writer = stack.enter_context(DgiiReportWriter(self.env))
+                writer.write(part._report_header(counts[report_type]))
+                parts[report_type] = {'wizard': part, 'writer': writer, 'amount': 0.0, 'itbis': 0.0}
+
+            payments = self._get_606_payments(SQL("%s AND %s", period, conditions['606']))
+            flags = SQL(", ").join(
+                SQL("%s AS %s", cond, SQL.identifier(f'in_{report_type}'))
+                for report_type, cond in conditions.items()
+            )
+            for row in self._fetch_report_rows(where, flags):
+                for report_type, part in parts.items():
+                    if row[f'in_{report_type}']:
+                        line, amount, itbis = part['wizard']._format_move_row(row, payments)
+                        part['writer'].write(line)
+                        part['amount'] += amount
+                        part['itbis'] += itbis
+
+            handle, zip_path = tempfile.mkstemp(prefix='dgii_bundle_', suffix='.zip', dir=temp_directory(self.env))
+            os.close(handle)
+            try:
+                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    for report_type, part in parts.items():
+                        wizard, writer = part['wizard'], part['writer']
+                        count = counts[report_type]
+                        writer.write_lines(wizard._report_footer_lines(count, part['amount'], part['itbis']))
+                        writer.close()
+                        file_name = wizard._report_file_name()
+                        archive.write(writer.path, file_name)
+                        writer.discard()
+                        summary.append(_('%s: %s registros, monto %s, ITBIS %s') % (
+                            file_name, count,
+                            self._format_amount_required(part['amount']),
+                            self._format_amount_required(part['itbis']),
+                        ))
+                    archive.writestr('RESUMEN.txt', '\n'.join(summary))
+            except Exception:
+                os.unlink(zip_path)
+                raise
 
-    def _generate_609(self):
-        invoices = self.env['account.move'].search([
-            ('company_id', '=', self.company_id.id),
-            ('move_type', '=', 'in_invoice'),
-            ('state', '=', 'posted'),
-            ('invoice_date', '>=', self.date_from),
-            ('invoice_date', '<=', self.date_to),
-            ('partner_id.country_id', '!=', False),
-            ('partner_id.country_id.code', '!=', 'DO'),
-        ], order='invoice_date')
-
-        lines = []
-        total_monto = 0.0
         rnc = self._clean_rnc(self.company_id.vat)
-        period = self.date_from.strftime('%Y%m')
-        lines.append(f"609|{rnc}|{period}|{len(invoices)}")
-
-        for inv in invoices:
-            razon_social = (inv.partner_id.name or '')[:50]
-            tipo_id = '2' if inv.partner_id.company_type == 'company' else '1'
-            id_tributaria = self._clean_rnc(inv.partner_id.vat) or 'N/A'
-            pais = 'US'
-            if inv.partner_id.country_id:
-                pais = inv.partner_id.country_id.code or 'US'
-            tipo_servicio = '02'
-            detalle_servicio = '02'
-            parte_relacionada = '0'
-            numero_doc = (inv.ref or inv.name or '')[:30]
-            fecha_doc = self._format_date(inv.invoice_date)
-            monto = abs(inv.amount_total)
-            fecha_retencion = fecha_doc
-            renta_presunta = monto
-            isr_retenido = monto * 0.27
-            total_monto += monto
-
-            campos = [
-                razon_social, tipo_id, id_tributaria, pais,
-                tipo_servicio, detalle_servicio, parte_relacionada,
-                numero_doc, fecha_doc,
-                self._format_amount_required(monto), fecha_retencion,
-                self._format_amount_required(renta_presunta),
-                self._format_amount_required(isr_retenido),
-            ]
-            lines.append('|'.join(campos))
-
-        content = '\n'.join(lines)
-        self.file_data = base64.b64encode(content.encode('utf-8'))
-        self.file_name = f"DGII_F_609_{rnc}_{period}.txt"
-        self.state = 'generated'
-        self.record_count = len(invoices)
-        self.total_amount = total_monto
+        file_name = f"DGII_Paquete_{rnc}_{self.date_from.strftime('%Y%m')}.zip"
+        self._own_attachment().unlink()
+        self.write({
+            'state': 'generated',
+            'attachment_id': store_file(
+                self.env, zip_path, file_name, mimetype='application/zip',
+                res_model=self._name, res_id=self.id,
+            ).id,
+            'file_name': file_name,
+            'record_count': sum(counts[report_type] for report_type in parts),
+            'bundle_summary': '\n'.join(summary),
+        })
         return self._return_wizard()
 
-    def _generate_ir17(self):
-        invoices = self.env['account.move'].search([
-            ('company_id', '=', self.company_id.id),
-            ('move_type', 'in', ('in_invoice', 'in_refund')),
-            ('state', '=', 'posted'),
-            ('invoice_date', '>=', self.date_from),
-            ('invoice_date', '<=', self.date_to),
-        ], order='invoice_date')
-
-        invoices_ret = invoices.filtered(
-            lambda i: (getattr(i, 'l10n_do_total_isr_retention', 0) or 0) > 0 or
-                      (getattr(i, 'l10n_do_total_itbis_retention', 0) or 0) > 0
-        )
-
-        if not invoices_ret:
+    def _report_count(self, where):
+        """Cantidad de registros del encabezado del reporte"""
+        count = self._count_report_rows(where)
+        if self.report_type == '608':
+            count += self._voided_count()
+        elif self.report_type == 'ir17' and not count:
             raise UserError(_('No hay facturas con retenciones en el periodo seleccionado.'))
+        return count
 
-        lines = []
-        total_isr = 0.0
-        total_itbis = 0.0
+    def _report_header(self, count):
+        if self.report_type == 'ir17':
+            return 'RNC|Proveedor|NCF|Fecha|Monto|ITBIS|Ret.ISR|Ret.ITBIS'
         rnc = self._clean_rnc(self.company_id.vat)
         period = self.date_from.strftime('%Y%m')
+        return f"{self.report_type}|{rnc}|{period}|{count}"
 
-        lines.append('RNC|Proveedor|NCF|Fecha|Monto|ITBIS|Ret.ISR|Ret.ITBIS')
-
-        for inv in invoices_ret:
-            isr = getattr(inv, 'l10n_do_total_isr_retention', 0) or 0
-            itbis = getattr(inv, 'l10n_do_total_itbis_retention', 0) or 0
-            total_isr += isr
-            total_itbis += itbis
-            campos = [
-                self._clean_rnc(inv.partner_id.vat),
-                (inv.partner_id.name or '')[:40],
-                getattr(inv, 'l10n_do_vendor_ncf', '') or '',
-                self._format_date(inv.invoice_date),
-                self._format_amount_required(inv.amount_untaxed),
-                self._format_amount(inv.amount_tax),
-                self._format_amount(isr),
-                self._format_amount(itbis),
+    def _report_file_name(self):
+        rnc = self._clean_rnc(self.company_id.vat)
+        period = self.date_from.strftime('%Y%m')
+        if self.report_type == 'ir17':
+            return f"IR17_Resumen_{rnc}_{period}.txt"
+        return f"DGII_F_{self.report_type}_{rnc}_{period}.txt"
+
+    def _format_report_row(self, row):
+        """Linea del reporte para una fila de ``_report_source``"""
+        if self.report_type in LEDGER_REPORTS:
+            return row['line'], row['amount'], row['itbis']
+        return self._format_move_row(row, {})
+
+    def _format_move_row(self, row, payments):
+        """
+        Linea del reporte para una factura leida con ``REPORT_COLUMNS``.
+
+        :return: (linea, monto, itbis); en el IR-17 los montos son las
+                 retenciones de ISR e ITBIS
+        """
+        if self.report_type == '606':
+            return self._format_606_row(row, payments)
+        if self.report_type == '607':
+            return self._format_607_row(row)
+        if self.report_type == '608':
+            return self._format_608_row(row)
+        if self.report_type == '609':
+            return self._format_609_row(row)
+        return self._format_ir17_row(row)
+
+    def _report_footer_lines(self, count, total_amount, total_itbis):
+        """Lineas que siguen a las facturas: anulados del 608 o resumen del IR-17"""
+        if self.report_type == '608':
+            self.env.cr.execute(SQL(
+                "SELECT name, date, reason FROM l10n_do_ncf_voided WHERE %s ORDER BY date, name",
+                self._voided_where(),
+            ))
+            return [
+                '|'.join([self._pad_ncf(name), self._format_date(void_date), reason])
+                for name, void_date, reason in self.env.cr.fetchall()
             ]
-            lines.append('|'.join(campos))
-
-        lines.extend([
+        if self.report_type != 'ir17':
+            return []
+        rnc = self._clean_rnc(self.company_id.vat)
+        period = self.date_from.strftime('%Y%m')
+        return [
             '',
             '=' * 50,
             f'RESUMEN IR-17 - Periodo: {period}',
             f'Empresa: {self.company_id.name}',
             f'RNC: {rnc}',
             '=' * 50,
-            f'Total Retencion ISR:   RD$ {self._format_amount_required(total_isr)}',
+            f'Total Retencion ISR:   RD$ {self._format_amount_required(total_amount)}',
             f'Total Retencion ITBIS: RD$ {self._format_amount_required(total_itbis)}',
             '-' * 50,
-            f'TOTAL A PAGAR DGII:    RD$ {self._format_amount_required(total_isr + total_itbis)}',
+            f'TOTAL A PAGAR DGII:    RD$ {self._format_amount_required(total_amount + total_itbis)}',
             '=' * 50,
-            f'Cantidad de Facturas: {len(invoices_ret)}',
-        ])
-
-        content = '\n'.join(lines)
-        self.file_data = base64.b64encode(content.encode('utf-8'))
-        self.file_name = f"IR17_Resumen_{rnc}_{period}.txt"
-        self.state = 'generated'
-        self.record_count = len(invoices_ret)
-        self.ir17_total_isr = total_isr
-        self.ir17_total_itbis = total_itbis
-        self.ir17_total = total_isr + total_itbis
-        return self._return_wizard()
+            f'Cantidad de Facturas: {count}',
+        ]
+
+    def _report_values(self, count, total_amount, total_itbis):
+        """Valores del resumen del asistente para un reporte generado"""
+        values = {'state': 'generated', 'record_count': count}
+        if self.report_type == 'ir17':
+            values.update({
+                'ir17_total_isr': total_amount,
+                'ir17_total_itbis': total_itbis,
+                'ir17_total': total_amount + total_itbis,
+            })
+        else:
+            values.update({'total_amount': total_amount, 'total_itbis': total_itbis})
+        return values
+
+    def _get_606_payments(self, where):
+        """
+        Fecha del ultimo pago conciliado y tipos de diario de los pagos de
+        cada factura pagada del periodo, con una sola consulta sobre las
+        conciliaciones parciales.
+
+        :return: {move_id: (fecha, [tipos de diario])}
+        """
+        self.env.cr.execute(SQL("""
+            WITH bill_lines AS (
+                SELECT aml.id, aml.move_id
+                FROM account_move_line aml
+                WHERE aml.account_type IN ('liability_payable', 'asset_receivable')
+                  AND aml.move_id IN (
+                      SELECT m.id %s
+                      WHERE %s AND m.payment_state IN ('paid', 'in_payment')
+                  )
+            ),
+            counterparts AS (
+                SELECT bl.move_id, cp.move_id AS counterpart_move_id
+                FROM bill_lines bl
+                JOIN account_partial_reconcile apr ON apr.credit_move_id = bl.id
+                JOIN account_move_line cp ON cp.id = apr.debit_move_id
+                UNION ALL
+                SELECT bl.move_id, cp.move_id
+                FROM bill_lines bl
+                JOIN account_partial_reconcile apr ON apr.debit_move_id = bl.id
+                JOIN account_move_line cp ON cp.id = apr.credit_move_id
+            )
+            SELECT c.move_id, MAX(pay.date), ARRAY_AGG(DISTINCT journal.type)
+            FROM counterparts c
+            JOIN account_payment pay ON pay.move_id = c.counterpart_move_id
+            JOIN account_journal journal ON journal.id = pay.journal_id
+            GROUP BY c.move_id
+        """, SQL(REPORT_FROM), where))
+        return {move_id: (pay_date, types) for move_id, pay_date, types in self.env.cr.fetchall()}
+
+    def _format_606_row(self, row, payments):
+        rnc_supplier = self._clean_rnc(row['partner_vat'])
+        tipo_id = self._get_rnc_type(row['partner_vat'])
+
+        if not rnc_supplier:
+            rnc_supplier = '00000000001'
+            tipo_id = '2'  # DGII exige tipo_id=2 para suplidor informal
+
+        tipo_bienes = self._validate_tipo_bienes(row['l10n_do_expense_type'] or '02')
+
+        ncf = self._pad_ncf(row['l10n_do_vendor_ncf'] or '')
+
+        ncf_modificado = ''
+        if row['move_type'] == 'in_refund' and row['reversed_entry_id']:
+            ncf_modificado = self._pad_ncf_modified(row['origin_vendor_ncf'] or '')
+
+        fecha_comprobante = self._format_date(row['invoice_date'])
+
+        fecha_pago = ''
+        pay_date, journal_types = payments.get(row['id'], (None, ()))
+        if pay_date and row['payment_state'] in ('paid', 'in_payment'):
+            fecha_pago = self._format_date(max(pay_date, row['invoice_date']))
+
+        monto_bienes = 0.0
+        monto_servicios = abs(row['amount_untaxed'] or 0)
+        monto_total = monto_bienes + monto_servicios
+        itbis_facturado = abs(row['amount_tax'] or 0)
+
+        itbis_retenido = abs(row['itbis_retention'])
+        itbis_proporcionalidad = 0.0
+        itbis_costo = 0.0
+        itbis_adelantar = itbis_facturado - itbis_costo if itbis_facturado > itbis_costo else 0
+        itbis_percibido = 0.0
+
+        tipo_retencion_isr = ''
+        monto_isr = abs(row['isr_retention'])
+        if monto_isr > 0:
+            tipo_retencion_isr = '02'
+
+        isr_percibido = 0.0
+        isc = 0.0
+        otros_impuestos = 0.0
+        propina_legal = 0.0
+
+        if len(journal_types) > 1:
+            forma_pago = '07'  # Pagos de diarios de distinto tipo: mixto
+        elif journal_types:
+            forma_pago = PAYMENT_FORM_BY_JOURNAL.get(journal_types[0], '02')
+        elif row['payment_state'] == 'paid':
+            forma_pago = '02'
+        elif row['payment_state'] == 'not_paid':
+            forma_pago = '04'
+        else:
+            forma_pago = '07'
+
+        campos = [
+            rnc_supplier, tipo_id, tipo_bienes, ncf, ncf_modificado,
+            fecha_comprobante, fecha_pago,
+            self._format_amount(monto_bienes), self._format_amount(monto_servicios),
+            self._format_amount_required(monto_total), self._format_amount(itbis_facturado),
+            self._format_amount(itbis_retenido), self._format_amount(itbis_proporcionalidad),
+            self._format_amount(itbis_costo), self._format_amount(itbis_adelantar),
+            self._format_amount(itbis_percibido), tipo_retencion_isr,
+            self._format_amount(monto_isr), self._format_amount(isr_percibido),
+            self._format_amount(isc), self._format_amount(otros_impuestos),
+            self._format_amount(propina_legal), forma_pago,
+        ]
+        return '|'.join(campos), monto_total, itbis_facturado
+
+    def _format_607_row(self, row):
+        rnc_client = self._clean_rnc(row['partner_vat'])
+
+        if rnc_client:
+            tipo_id = self._get_rnc_type(row['partner_vat'])
+        else:
+            tipo_id = '3'
+            rnc_client = '00000000000'
+
+        ncf = self._pad_ncf(row['l10n_do_ncf_number'] or '')
+
+        ncf_modificado = ''
+        if row['move_type'] == 'out_refund':
+            ncf_modificado = self._pad_ncf_modified(row['l10n_do_ncf_origin'] or '')
+
+        tipo_ingreso = '02'
+        if (row['ncf_type_code'] or '') in ('B01', 'B02', 'B14', 'B15'):
+            tipo_ingreso = '01'
+
+        fecha_comprobante = self._format_date(row['invoice_date'])
+        fecha_retencion = ''
+
+        monto_facturado = abs(row['amount_untaxed'] or 0)
+        itbis_facturado = abs(row['amount_tax'] or 0)
+
+        itbis_retenido_terceros = 0.0
+        itbis_percibido = 0.0
+        retencion_renta_terceros = 0.0
+        isr_percibido = 0.0
+        isc = 0.0
+        otros_impuestos = 0.0
+        propina_legal = 0.0
+
+        monto_total_con_itbis = abs(row['amount_total'] or 0)
+
+        efectivo = 0.0
+        cheque = 0.0
+        tarjeta = 0.0
+        credito = 0.0
+        bonos = 0.0
+        permuta = 0.0
+        otras = 0.0
+
+        if row['payment_state'] == 'paid':
+            cheque = monto_total_con_itbis
+        elif row['payment_state'] == 'not_paid':
+            credito = monto_total_con_itbis
+        elif row['payment_state'] == 'partial':
+            residual = abs(row['amount_residual'] or 0)
+            cheque = monto_total_con_itbis - residual
+            credito = residual
+        else:
+            credito = monto_total_con_itbis
+
+        campos = [
+            rnc_client, tipo_id, ncf, ncf_modificado, tipo_ingreso,
+            fecha_comprobante, fecha_retencion,
+            self._format_amount_required(monto_facturado), self._format_amount(itbis_facturado),
+            self._format_amount(itbis_retenido_terceros), self._format_amount(itbis_percibido),
+            self._format_amount(retencion_renta_terceros), self._format_amount(isr_percibido),
+            self._format_amount(isc), self._format_amount(otros_impuestos),
+            self._format_amount(propina_legal),
+            self._format_amount(efectivo), self._format_amount(cheque),
+            self._format_amount(tarjeta), self._format_amount(credito),
+            self._format_amount(bonos), self._format_amount(permuta),
+            self._format_amount(otras),
+        ]
+        return '|'.join(campos), monto_facturado, itbis_facturado
+
+    def _format_608_row(self, row):
+        campos = [self._pad_ncf(row['l10n_do_ncf_number'] or ''), self._format_date(row['invoice_date']), '04']
+        return '|'.join(campos), 0.0, 0.0
+
+    def _voided_count(self):
+        """NCF anulados sin factura (arrendamientos no usados, etc.)"""
+        self.env.cr.execute(SQL("SELECT COUNT(*) FROM l10n_do_ncf_voided WHERE %s", self._voided_where()))
+        return self.env.cr.fetchone()[0]
+
+    def _voided_where(self):
+        return SQL(
+            "company_id = %s AND date BETWEEN %s AND %s",
+            self.company_id.id, self.date_from, self.date_to,
+        )
+
+    def _format_609_row(self, row):
+        razon_social = (row['partner_name'] or '')[:50]
+        tipo_id = '2' if row['partner_is_company'] else '1'
+        id_tributaria = self._clean_rnc(row['partner_vat']) or 'N/A'
+        pais = row['partner_country_code'] or 'US'
+        tipo_servicio = '02'
+        detalle_servicio = '02'
+        parte_relacionada = '0'
+        numero_doc = (row['ref'] or row['name'] or '')[:30]
+        fecha_doc = self._format_date(row['invoice_date'])
+        monto = abs(row['amount_total'] or 0)
+        fecha_retencion = fecha_doc
+        renta_presunta = monto
+        isr_retenido = monto * 0.27
+
+        campos = [
+            razon_social, tipo_id, id_tributaria, pais,
+            tipo_servicio, detalle_servicio, parte_relacionada,
+            numero_doc, fecha_doc,
+            self._format_amount_required(monto), fecha_retencion,
+            self._format_amount_required(renta_presunta),
+            self._format_amount_required(isr_retenido),
+        ]
+        return '|'.join(campos), monto, 0.0
+
+    def _format_ir17_row(self, row):
+        isr = row['isr_retention']
+        itbis = row['itbis_retention']
+        campos = [
+            self._clean_rnc(row['partner_vat']),
+            (row['partner_name'] or '')[:40],
+            row['l10n_do_vendor_ncf'] or '',
+            self._format_date(row['invoice_date']),
+            self._format_amount_required(row['amount_untaxed']),
+            self._format_amount(row['amount_tax']),
+            self._format_amount(isr),
+            self._format_amount(itbis),
+        ]
+        return '|'.join(campos), isr, itbis
+
+    def unlink(self):
+        # Los archivos generados pertenecen al asistente transitorio
+        self._own_attachment().unlink()
+        return super().unlink()
 
     def _return_wizard(self):
         return {
@@ -493,19 +768,23 @@ class DgiiReportWizard(models.TransientModel):
 
     def action_download(self):
         self.ensure_one()
-        if not self.file_data:
+        # Los reportes en segundo plano quedan adjuntos al trabajo
+        attachment = self.attachment_id or self.job_id.attachment_id
+        if not attachment:
             raise UserError(_('Primero debe generar el reporte.'))
         return {
             'type': 'ir.actions.act_url',
-            'url': f'/web/content?model={self._name}&id={self.id}&field=file_data&filename_field=file_name&download=true',
+            'url': f'/web/content/{attachment.id}?download=true',
             'target': 'self',
         }
 
     def action_reset(self):
         self.ensure_one()
+        self._own_attachment().unlink()
         self.write({
             'state': 'draft',
-            'file_data': False,
+            'attachment_id': False,
+            'job_id': False,
             'file_name': False,
             'record_count': 0,
             'total_amount': 0,
@@ -513,5 +792,6 @@ class DgiiReportWizard(models.TransientModel):
             'ir17_total_isr': 0,
             'ir17_total_itbis': 0,
             'ir17_total': 0,
+            'bundle_summary': False,
         })
         return self._return_wizard()
@@ -215,7 +215,7 @@ class NCFSetupWizard(models.TransientModel):
         for create_field, type_code, start_field, end_field in sequences_config:
             if getattr(self, create_field):
                 # Buscar el tipo NCF por su codigo (01, 02, 14, 15)
-                ncf_type = NCFType.search([('code', '=', type_code)], limit=1)
+                ncf_type = NCFType._get_by_code(type_code)
                 if ncf_type:
                     # Verificar si ya existe una secuencia con este tipo
                     existing = NCFSequence.search([